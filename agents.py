@@ -1,7 +1,9 @@
 # agents.py
 import os
-import json
+import time
+import contextvars
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import token
 from huggingface_hub import InferenceClient
@@ -10,20 +12,96 @@ from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
 from config import LLM_MODEL, OPENROUTER_API_KEY, HF_IMAGE_MODEL, HF_API_TOKEN, LINKEDIN_ACCESS_TOKEN, LINKEDIN_USER_ID, LINKEDIN_UGC_URL
-from rag import run_rag
+from config import VARIANT_COUNT, VARIANT_MODE, VARIANT_TEMPERATURE, COMPLETION_TOKENS
+from outbox import linkedin_headers, linkedin_payload
+from profiling import track_thread
+from rag import plan_and_retrieve
+from scheduler import estimate_tokens, response_tokens, throttle
+from storage import load_prewarmed
+from structured import IMAGE_PROMPT_SCHEMA, StructuredOutputError, invoke_structured
 from tools import tavily_search_with_content
 
 
+# --------------------------------------------------
+# Multi-variant completions
+# --------------------------------------------------
+
+def _invoke_throttled(llm, prompt_value, completion_tokens: int):
+    with throttle(
+        "openrouter",
+        tokens=estimate_tokens(prompt_value.to_string()),
+        completion_tokens=completion_tokens,
+    ) as charge:
+        response = llm.invoke(prompt_value)
+        charge.settle(response_tokens(response))
+    return response.content
+
+
+def _variant_worker(llm, prompt_value, completion_tokens: int):
+    # Sampled with the pipeline thread when the run is being profiled
+    with track_thread():
+        return _invoke_throttled(llm, prompt_value, completion_tokens)
+
+
+def generate_variants(llm, prompt_value, n: int, completion_tokens: int):
+    """
+    n completions of ONE formatted prompt (research/blog input is shared).
+    VARIANT_MODE="n" asks the provider for n choices in a single request;
+    anything it does not return (or VARIANT_MODE="batch") is filled by
+    concurrent calls, each throttled in the caller's priority context.
+    `completion_tokens` is the expected size of ONE completion.
+    """
+    if n <= 1:
+        return [_invoke_throttled(llm, prompt_value, completion_tokens)]
+
+    variants = []
+
+    if VARIANT_MODE == "n":
+        with throttle(
+            "openrouter",
+            tokens=estimate_tokens(prompt_value.to_string()),
+            completion_tokens=completion_tokens * n,
+        ) as charge:
+            result = llm.generate([prompt_value.to_messages()], n=n)
+            charge.settle(response_tokens(result))
+        variants = [g.text for g in result.generations[0]][:n]
+
+    missing = n - len(variants)
+    if missing:
+        with ThreadPoolExecutor(max_workers=missing) as pool:
+            futures = [
+                pool.submit(
+                    contextvars.copy_context().run,
+                    _variant_worker,
+                    llm,
+                    prompt_value,
+                    completion_tokens,
+                )
+                for _ in range(missing)
+            ]
+            variants.extend(f.result() for f in futures)
+
+    return variants
+
+
 # --------------------------------------------------
 # Research Agent
 # --------------------------------------------------
 
 class ResearchAgent:
     def run(self, topic, log):
+        return self.run_stages(topic, log)["research"]
+
+    def run_stages(self, topic, log):
+        """
+        Same as run(), but returns every intermediate stage
+        (plan, catalog, web, research) so prewarm.py can store them.
+        """
         log("RESEARCH", "ResearchAgent started")
 
         log("RESEARCH", "Running internal product RAG")
-        catalog_research = run_rag(topic, log)
+        rag = plan_and_retrieve(topic, log)
+        catalog_research = rag["catalog"]
 
         log("RESEARCH", "Fetching Tavily cached web intelligence")
         web_results = tavily_search_with_content(topic)
@@ -48,6 +126,7 @@ class ResearchAgent:
             You are a senior beauty product marketing analyst.
 
             INTERNAL PRODUCT CATALOG (SOURCE OF TRUTH):
+            Precomputed analytics — figures are exact, quote them as-is.
             {catalog}
 
             EXTERNAL MARKET INTELLIGENCE:
@@ -56,7 +135,8 @@ class ResearchAgent:
             TASK:
             1. Select best-matching catalog products
             2. Add competitive positioning (non-medical)
-            3. Highlight pricing and rating advantages
+            3. Highlight pricing and rating advantages using the catalog
+               figures above (do not recompute or estimate numbers)
             4. Produce a structured research brief for blog creation
 
             TOPIC:
@@ -74,10 +154,22 @@ class ResearchAgent:
         )
 
         # Then send it to the LLM
-        final_research = llm.invoke(prompt_value).content
+        with throttle(
+            "openrouter",
+            tokens=estimate_tokens(prompt_value.to_string()),
+            completion_tokens=COMPLETION_TOKENS["research"],
+        ) as charge:
+            response = llm.invoke(prompt_value)
+            charge.settle(response_tokens(response))
+        final_research = response.content
 
         log("RESEARCH", "Research synthesis completed")
-        return final_research
+        return {
+            "plan": rag["plan"],
+            "catalog": catalog_research,
+            "web": combined_web,
+            "research": final_research,
+        }
 
 
 # --------------------------------------------------
@@ -86,14 +178,17 @@ class ResearchAgent:
 
 class BlogWriterAgent:
     def run(self, research, topic, log):
+        return self.run_variants(research, topic, log, n=1)[0]
+
+    def run_variants(self, research, topic, log, n=VARIANT_COUNT):
         log("BLOG", "BlogWriterAgent started")
-        log("BLOG", "Drafting marketing blog")
+        log("BLOG", f"Drafting {n} marketing blog variant(s)" if n > 1 else "Drafting marketing blog")
 
         llm = ChatOpenAI(
             model=LLM_MODEL,
             openai_api_key=OPENROUTER_API_KEY,
             openai_api_base="https://openrouter.ai/api/v1",
-            temperature=0.3,
+            temperature=VARIANT_TEMPERATURE if n > 1 else 0.3,
         )
 
         prompt = ChatPromptTemplate.from_template(
@@ -134,10 +229,10 @@ class BlogWriterAgent:
             }
         )
 
-        blog = llm.invoke(prompt_value).content
+        blogs = generate_variants(llm, prompt_value, n, COMPLETION_TOKENS["blog"])
 
         log("BLOG", "Blog generation completed")
-        return blog
+        return blogs
 
 
 # --------------------------------------------------
@@ -190,12 +285,13 @@ class ImageGeneratorAgent:
         )
 
         prompt_value = prompt.invoke({"blog": blog})
-        image_prompt_json = llm.invoke(prompt_value).content
 
         try:
-            image_prompt = json.loads(image_prompt_json)
-        except json.JSONDecodeError:
-            raise ValueError("Failed to parse image prompt JSON")
+            image_prompt = invoke_structured(
+                llm, prompt_value, IMAGE_PROMPT_SCHEMA, "image_prompt", emit_event, "IMAGE"
+            )
+        except StructuredOutputError as e:
+            raise ValueError(f"Failed to parse image prompt JSON: {e}")
 
         emit_event("IMAGE", "Image prompt generated successfully")
 
@@ -204,10 +300,11 @@ class ImageGeneratorAgent:
         # -----------------------------
         emit_event("IMAGE", "Generating image using Hugging Face FLUX model")
 
-        image = self.client.text_to_image(
-            image_prompt["prompt"],
-            model=self.model,
-        )
+        with throttle("huggingface"):
+            image = self.client.text_to_image(
+                image_prompt["prompt"],
+                model=self.model,
+            )
 
         # -----------------------------
         # 3. Save image
@@ -239,14 +336,17 @@ class ImageGeneratorAgent:
 
 class LinkedInPostAgent:
     def run(self, blog, log):
+        return self.run_variants(blog, log, n=1)[0]
+
+    def run_variants(self, blog, log, n=VARIANT_COUNT):
         log("LINKEDIN", "LinkedInPostAgent started")
-        log("LINKEDIN", "Generating LinkedIn marketing post")
+        log("LINKEDIN", f"Generating {n} LinkedIn post variant(s)" if n > 1 else "Generating LinkedIn marketing post")
 
         llm = ChatOpenAI(
             model=LLM_MODEL,
             openai_api_key=OPENROUTER_API_KEY,
             openai_api_base="https://openrouter.ai/api/v1",
-            temperature=0.3,
+            temperature=VARIANT_TEMPERATURE if n > 1 else 0.3,
         )
 
         prompt = ChatPromptTemplate.from_template(
@@ -274,14 +374,15 @@ class LinkedInPostAgent:
             }
         )
 
-        post = llm.invoke(prompt_value).content
+        posts = generate_variants(llm, prompt_value, n, COMPLETION_TOKENS["linkedin"])
 
         log("LINKEDIN", "LinkedIn post generation completed")
-        return post
+        return posts
 
 class LinkedInPostSubmitAgent:
     """
     Posts content to a PERSONAL LinkedIn profile using an existing access token.
+    Synchronous; the UI publishes through outbox.LinkedInOutbox instead.
     """
 
     def __init__(self, access_token: str = None, user_id: str = None):
@@ -297,27 +398,8 @@ class LinkedInPostSubmitAgent:
     def post(self, text: str, emit_event):
         emit_event("LINKEDIN", "Preparing LinkedIn personal post")
 
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
-            "X-Restli-Protocol-Version": "2.0.0",
-        }
-
-        payload = {
-            "author": f"urn:li:person:{self.user_id}",
-            "lifecycleState": "PUBLISHED",
-            "specificContent": {
-                "com.linkedin.ugc.ShareContent": {
-                    "shareCommentary": {
-                        "text": text
-                    },
-                    "shareMediaCategory": "NONE",
-                }
-            },
-            "visibility": {
-                "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
-            },
-        }
+        headers = linkedin_headers(self.access_token)
+        payload = linkedin_payload(self.user_id, text)
 
         emit_event("LINKEDIN", "Sending post to LinkedIn")
 
@@ -351,17 +433,25 @@ class ContentOrchestrator:
         self.linkedin_agent = LinkedInPostAgent()
 
     def run(self, topic, log):
-        log("SYSTEM", "Dispatching ResearchAgent")
-        research = self.research_agent.run(topic, log)
+        warm = load_prewarmed(topic)
+
+        if warm:
+            age_min = int((time.time() - warm["created_at"]) / 60)
+            log("SYSTEM", f"Using pre-warmed research ({age_min} min old)")
+            research = warm["research"]
+        else:
+            log("SYSTEM", "Dispatching ResearchAgent")
+            research = self.research_agent.run(topic, log)
 
         log("SYSTEM", "Dispatching BlogWriterAgent")
-        blog = self.blog_agent.run(research, topic, log)
+        blogs = self.blog_agent.run_variants(research, topic, log, n=VARIANT_COUNT)
+        blog = blogs[0]
 
         log("SYSTEM", "Dispatching ImageGeneratorAgent")
         images = self.image_agent.run(blog, log)
 
         log("SYSTEM", "Dispatching LinkedInPostAgent")
-        linkedin = self.linkedin_agent.run(blog, log)
+        linkedins = self.linkedin_agent.run_variants(blog, log, n=VARIANT_COUNT)
 
         log("SYSTEM", "All agents completed")
 
@@ -371,5 +461,7 @@ class ContentOrchestrator:
             "research": research,
             "blog": blog,
             "images": images,
-            "linkedin": linkedin,
+            "linkedin": linkedins[0],
+            "blog_variants": blogs,
+            "linkedin_variants": linkedins,
         }
@@ -0,0 +1,231 @@
+# analytics.py
+"""
+Precomputed catalog analytics.
+
+Built once from data/products.csv (rebuilt automatically when the CSV
+changes) and persisted as JSON. Per category / subcategory / brand /
+country it holds price percentiles, rating distributions, best-value
+rankings and the cheapest top-rated items, so agents get exact numbers
+instead of asking the LLM to do arithmetic on a few retrieved rows.
+"""
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+DATA_PATH = "data/products.csv"
+ANALYTICS_PATH = "data/catalog_analytics.json"
+
+DIMENSIONS = ["category", "subcategory", "brand", "country"]
+PERCENTILES = [10, 25, 50, 75, 90]
+RATING_BUCKETS = [("<3.0", 0, 3.0), ("3.0-3.9", 3.0, 4.0), ("4.0-4.4", 4.0, 4.5), ("4.5+", 4.5, 5.01)]
+TOP_RATED = 4.3
+TOP_N = 3
+ANALYTICS_VERSION = 2  # part of the cache signature; bump when groups change
+
+# Named slices that no single dimension captures: 1,502 of the 2,555
+# "body" rows are perfume, so body care is "body" without perfume
+SEGMENTS = {
+    "bodycare": lambda df: (df["category"] == "body") & (df["subcategory"] != "perfume"),
+}
+
+# Planner category → analytics groups (dimension, value)
+PLANNER_CATEGORY_MAP = {
+    "perfume": [("subcategory", "perfume")],
+    "bodycare": [("segment", "bodycare")],
+    "cosmetic": [("category", "lips"), ("category", "eyes"), ("category", "face")],
+    "skincare": [("category", "skincare")],
+    "haircare": [("category", "hair")],
+    "mixed": [("all", "all")],
+    "unknown": [("all", "all")],
+}
+
+_lock = threading.Lock()
+_cache = {"signature": None, "analytics": None}
+
+
+# --------------------------------------------------
+# Build
+# --------------------------------------------------
+
+def _signature(path: str = DATA_PATH) -> list:
+    stat = os.stat(path)
+    return [ANALYTICS_VERSION, stat.st_mtime_ns, stat.st_size]
+
+
+def _item(row) -> dict:
+    return {
+        "product_name": str(row["product_name"])[:60],
+        "brand": row["brand"],
+        "price": round(float(row["price"]), 2),
+        "rating": None if pd.isna(row["rating"]) else float(row["rating"]),
+    }
+
+
+def _group_stats(group: pd.DataFrame) -> dict:
+    prices = group["price"].dropna()
+    rated = group.dropna(subset=["rating"])
+
+    stats = {
+        "count": int(len(group)),
+        "rated_count": int(len(rated)),
+        "price": {
+            "min": round(float(prices.min()), 2),
+            "max": round(float(prices.max()), 2),
+            **{
+                f"p{p}": round(float(v), 2)
+                for p, v in zip(PERCENTILES, np.percentile(prices, PERCENTILES))
+            },
+        }
+        if len(prices)
+        else None,
+        "rating": {
+            "mean": round(float(rated["rating"].mean()), 2),
+            "distribution": {
+                label: int(((rated["rating"] >= lo) & (rated["rating"] < hi)).sum())
+                for label, lo, hi in RATING_BUCKETS
+            },
+        }
+        if len(rated)
+        else None,
+    }
+
+    # Best value: rating per log-price, rated products only
+    priced = rated[rated["price"] > 0]
+    value = priced.assign(value_score=priced["rating"] / np.log1p(priced["price"]))
+    stats["best_value"] = [
+        _item(r) for _, r in value.nlargest(TOP_N, "value_score").iterrows()
+    ]
+
+    top_rated = priced[priced["rating"] >= TOP_RATED]
+    stats["cheapest_top_rated"] = [
+        _item(r) for _, r in top_rated.nsmallest(TOP_N, "price").iterrows()
+    ]
+
+    return stats
+
+
+def build_analytics(path: str = DATA_PATH) -> dict:
+    df = pd.read_csv(path)
+    df["price"] = pd.to_numeric(df["price"], errors="coerce")
+    df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
+    # Some rows carry review counts ("14,338") in the rating column
+    df.loc[~df["rating"].between(0, 5), "rating"] = np.nan
+    df = df.drop_duplicates(subset=["product_name", "brand", "price"])
+
+    analytics = {
+        "source_signature": _signature(path),
+        "groups": {"all": {"all": _group_stats(df)}},
+    }
+
+    for dim in DIMENSIONS:
+        analytics["groups"][dim] = {
+            str(value): _group_stats(group)
+            for value, group in df.groupby(dim)
+        }
+
+    analytics["groups"]["segment"] = {
+        name: _group_stats(df[mask(df)]) for name, mask in SEGMENTS.items()
+    }
+
+    return analytics
+
+
+def _read_cache():
+    # A concurrent writer or a truncated file → treat as a cache miss
+    try:
+        with open(ANALYTICS_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(analytics: dict):
+    # Write-then-rename so readers never see a half-written file
+    directory = os.path.dirname(ANALYTICS_PATH) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(analytics, f)
+        os.replace(tmp_path, ANALYTICS_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def get_analytics() -> dict:
+    """
+    In-memory → JSON file → rebuild, keyed by the CSV's mtime/size.
+    """
+    signature = _signature()
+
+    with _lock:
+        if _cache["signature"] == signature:
+            return _cache["analytics"]
+
+        analytics = _read_cache()
+        if analytics is not None and analytics.get("source_signature") != signature:
+            analytics = None
+
+        if analytics is None:
+            analytics = build_analytics()
+            _write_cache(analytics)
+
+        _cache["signature"] = signature
+        _cache["analytics"] = analytics
+        return analytics
+
+
+# --------------------------------------------------
+# Lookup + compact context
+# --------------------------------------------------
+
+def lookup(dimension: str, value: str):
+    return get_analytics()["groups"].get(dimension, {}).get(value)
+
+
+def _fmt_items(items) -> str:
+    return "; ".join(
+        f"{i['product_name']} ({i['brand']}) ₹{i['price']:g}, {i['rating']:g}★"
+        for i in items
+    ) or "none"
+
+
+def format_insights(category: str) -> str:
+    """
+    Compact, LLM-ready analytics block for a planner category.
+    Prices are INR as stored in the catalog.
+    """
+    groups = PLANNER_CATEGORY_MAP.get(category, PLANNER_CATEGORY_MAP["unknown"])
+
+    lines = []
+    for dim, value in groups:
+        stats = lookup(dim, value)
+        if not stats:
+            continue
+
+        lines.append(f"[{dim}={value}] products={stats['count']}")
+
+        price = stats["price"]
+        if price:
+            lines.append(
+                f"  price INR: min={price['min']:g} p25={price['p25']:g} "
+                f"median={price['p50']:g} p75={price['p75']:g} max={price['max']:g}"
+            )
+
+        rating = stats["rating"]
+        if rating:
+            dist = ", ".join(f"{k}: {v}" for k, v in rating["distribution"].items())
+            lines.append(
+                f"  rating: mean={rating['mean']:g} over {stats['rated_count']} rated ({dist})"
+            )
+
+        lines.append(f"  best value: {_fmt_items(stats['best_value'])}")
+        lines.append(
+            f"  cheapest rated ≥{TOP_RATED:g}★: {_fmt_items(stats['cheapest_top_rated'])}"
+        )
+
+    return "\n".join(lines)
@@ -1,14 +1,20 @@
 # app.py
+import json
 import os
 import time
 import threading
-import queue
+from collections import deque
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-from agents import ContentOrchestrator, LinkedInPostAgent, LinkedInPostSubmitAgent
-from storage import load_history, add_to_history
-from config import APP_NAME
+from agents import ContentOrchestrator, LinkedInPostAgent
+from outbox import get_outbox
+from storage import add_to_history, load_record, search_history
+from config import APP_NAME, ENABLE_PREWARM, HISTORY_PAGE_SIZE, LOG_HISTORY_SIZE
+from events import EventChannel, RunAbandoned, weak_channel
+from prewarm import get_prewarm_scheduler
+from scheduler import PRIORITY_INTERACTIVE, request_context, scheduler
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # --------------------------------------------------
@@ -16,14 +22,18 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # --------------------------------------------------
 st.set_page_config(page_title=APP_NAME, layout="wide")
 
+# Process-wide; pre-warms research off-peak at bulk priority
+if ENABLE_PREWARM:
+    get_prewarm_scheduler()
+
 # --------------------------------------------------
 # Session state initialization
 # --------------------------------------------------
-if "history" not in st.session_state:
-    st.session_state.history = load_history()
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
 
 if "logs" not in st.session_state:
-    st.session_state.logs = []
+    st.session_state.logs = deque(maxlen=LOG_HISTORY_SIZE)
 
 if "result" not in st.session_state:
     st.session_state.result = None
@@ -34,8 +44,11 @@ if "progress" not in st.session_state:
 if "is_running" not in st.session_state:
     st.session_state.is_running = False
 
-if "event_queue" not in st.session_state:
-    st.session_state.event_queue = queue.Queue()
+if "events" not in st.session_state:
+    st.session_state.events = EventChannel()
+
+if "event_seq" not in st.session_state:
+    st.session_state.event_seq = 0
 
 if "topic" not in st.session_state:
     st.session_state.topic = ""
@@ -56,45 +69,82 @@ LOG_COLORS = {
 # --------------------------------------------------
 # Background pipeline (NO Streamlit calls)
 # --------------------------------------------------
-def run_pipeline(topic: str, event_q: queue.Queue):
+def run_pipeline(topic: str, channel, user: str, profile: bool = False):
+    # Weak reference only: the channel dies with its session (or on reset),
+    # and the next emit then aborts this abandoned run.
     def emit_event(stage: str, message: str):
-        event_q.put(("log", stage, message))
-
-    try:
-        emit_event("SYSTEM", "Starting content generation")
-        event_q.put(("progress", 10))
-
-        orchestrator = ContentOrchestrator()
-        result = orchestrator.run(topic, emit_event)
-
-        event_q.put(("result", result))
-        event_q.put(("progress", 100))
-        emit_event("SYSTEM", "All agents completed")
-
-    except Exception as e:
-        emit_event("ERROR", str(e))
-        event_q.put(("progress", 0))
+        channel().log(stage, message)
+
+    profiler = None
+    if profile:
+        # Opt-in only: when off, nothing is sampled, traced or wrapped
+        from profiling import RunProfiler
+
+        profiler = RunProfiler().start()
+        log_event = emit_event
+
+        def emit_event(stage: str, message: str):
+            profiler.mark(stage)  # memory snapshot on stage change
+            log_event(stage, message)
+
+    # Interactive priority, fair-queued per browser session
+    with request_context(PRIORITY_INTERACTIVE, user):
+        try:
+            emit_event("SYSTEM", "Starting content generation")
+            channel().set_progress(10)
+
+            orchestrator = ContentOrchestrator()
+            result = orchestrator.run(topic, emit_event)
+
+            if profiler:
+                result["profile"] = profiler.stop()
+
+            channel().set_result(result)
+            channel().set_progress(100)
+            emit_event("SYSTEM", "All agents completed")
+
+        except RunAbandoned:
+            return
+
+        except Exception as e:
+            try:
+                emit_event("ERROR", str(e))
+                channel().set_progress(0)
+            except RunAbandoned:
+                return
+
+        finally:
+            if profiler:
+                profiler.stop()
+            try:
+                channel().close()
+            except RunAbandoned:
+                pass
 
 # --------------------------------------------------
 # Process background events (MAIN THREAD ONLY)
 # --------------------------------------------------
-while not st.session_state.event_queue.empty():
-    event = st.session_state.event_queue.get()
+events = st.session_state.events
 
-    if event[0] == "log":
-        _, stage, msg = event
-        st.session_state.logs.append((stage, msg))
+# Snapshot `done` BEFORE draining: anything the pipeline emitted before
+# close() is then guaranteed to be drained below. Reading it last could
+# stop polling with the result / final logs still unread.
+pipeline_done = events.done
 
-    elif event[0] == "progress":
-        st.session_state.progress = event[1]
+new_logs, st.session_state.event_seq = events.read_since(st.session_state.event_seq)
+st.session_state.logs.extend(new_logs)
 
-    elif event[0] == "result":
-        st.session_state.result = event[1]
-        st.session_state.history = add_to_history(
-            st.session_state.history,
-            event[1],
-        )
-        st.session_state.is_running = False
+progress = events.take_progress()
+if progress is not None:
+    st.session_state.progress = progress
+
+if events.result is not None:
+    st.session_state.result = events.result
+    st.session_state.result["run_id"] = add_to_history(events.result)
+    events.result = None
+
+if pipeline_done:
+    st.session_state.is_running = False
 
 # --------------------------------------------------
 # Title
@@ -112,13 +162,45 @@ col1, col2, col3 = st.columns([1, 2, 3], gap="large")
 with col1:
     st.subheader("🕘 History")
 
-    if st.session_state.history:
-        for item in reversed(st.session_state.history):
-            if st.button(item["topic"], key=f"hist_{item['topic']}"):
-                st.session_state.result = item
-                st.session_state.logs = [("INFO", "Loaded from history")]
+    history_query = st.text_input(
+        "Search history",
+        placeholder="Search topics, blogs, posts...",
+        key="history_query",
+        on_change=lambda: st.session_state.update(history_page=0),
+    )
+
+    rows, total = search_history(
+        history_query,
+        page=st.session_state.history_page,
+        page_size=HISTORY_PAGE_SIZE,
+    )
+
+    if rows:
+        for row in rows:
+            if st.button(row["topic"], key=f"hist_{row['id']}"):
+                # Heavy fields are loaded only for the clicked record
+                st.session_state.result = load_record(row["id"])
+                st.session_state.logs = deque(
+                    [("INFO", "Loaded from history")], maxlen=LOG_HISTORY_SIZE
+                )
                 st.session_state.progress = 100
                 st.session_state.is_running = False
+
+        pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+        prev_col, info_col, next_col = st.columns([1, 2, 1])
+
+        if prev_col.button("◀", disabled=st.session_state.history_page == 0):
+            st.session_state.history_page -= 1
+            st.rerun()
+
+        info_col.caption(f"Page {st.session_state.history_page + 1} / {pages} · {total} runs")
+
+        if next_col.button("▶", disabled=st.session_state.history_page + 1 >= pages):
+            st.session_state.history_page += 1
+            st.rerun()
+
+    elif history_query:
+        st.info("No matching history.")
     else:
         st.info("No history yet.")
 
@@ -144,21 +226,77 @@ with col2:
         disabled=st.session_state.is_running,
     )
 
+    profile_run = st.checkbox(
+        "🔬 Profile this run",
+        disabled=st.session_state.is_running,
+        help="Samples CPU stacks and snapshots memory at each agent stage.",
+    )
+
     # ---------- Reset ----------
     if reset_clicked:
         st.session_state.logs.clear()
         st.session_state.result = None
         st.session_state.progress = 0
-        st.session_state.event_queue = queue.Queue()
+        st.session_state.events = EventChannel()
+        st.session_state.event_seq = 0
         st.session_state.is_running = False
         st.session_state.topic = ""
         st.success("Ready for a new search.")
 
     st.progress(st.session_state.progress)
 
+    with st.expander("📊 Provider queues"):
+        st.json(scheduler.metrics())
+
+    run_profile = (st.session_state.result or {}).get("profile")
+    if run_profile:
+        with st.expander("🔬 Run profile"):
+            st.caption(
+                f"{run_profile['samples']} samples over {run_profile['duration_s']}s · "
+                f"peak {run_profile['peak_mb']} MB traced"
+            )
+            st.json(run_profile["time_split"])
+            st.dataframe(
+                [
+                    {
+                        "stage": s["stage"],
+                        "ended_at_s": s["ended_at_s"],
+                        "current_mb": s["current_mb"],
+                        "peak_mb": s["peak_mb"],
+                    }
+                    for s in run_profile["stages"]
+                ],
+                hide_index=True,
+            )
+
+            run_id = st.session_state.result.get("run_id")
+            st.download_button(
+                "⬇️ CPU stacks (collapsed, flame graph)",
+                run_profile["collapsed"],
+                file_name=f"run_{run_id}_cpu.folded",
+                key=f"profile_cpu_{run_id}",
+            )
+            st.download_button(
+                "⬇️ Allocation sites (JSON)",
+                json.dumps(
+                    {
+                        "top_allocations": run_profile["top_allocations"],
+                        "stages": run_profile["stages"],
+                    },
+                    indent=2,
+                ),
+                file_name=f"run_{run_id}_memory.json",
+                key=f"profile_mem_{run_id}",
+            )
+
     st.markdown("---")
     st.subheader("⚙️ Agent Logs")
 
+    if st.session_state.events.dropped:
+        st.caption(
+            f"{st.session_state.events.dropped} low-priority log lines dropped under load"
+        )
+
     log_container = st.container(height=320)
     with log_container:
         for stage, msg in st.session_state.logs:
@@ -199,17 +337,25 @@ with col2:
             st.session_state.result = None
             st.session_state.progress = 0
             st.session_state.is_running = True
-            st.session_state.event_queue = queue.Queue()
+            st.session_state.events = EventChannel()
+            st.session_state.event_seq = 0
 
             threading.Thread(
                 target=run_pipeline,
-                args=(st.session_state.topic, st.session_state.event_queue),
+                args=(
+                    st.session_state.topic,
+                    weak_channel(st.session_state.events),
+                    get_script_run_ctx().session_id,
+                    profile_run,
+                ),
                 daemon=True,
             ).start()
 
 # --------------------------------------------------
 # COLUMN 3 — BLOG + IMAGE + LINKEDIN
 # --------------------------------------------------
+outbox_pending = False
+
 with col3:
     st.subheader("📝 Blog Output")
 
@@ -231,6 +377,18 @@ with col3:
                         width=380,   # blog-header sized
                     )
 
+            # Blog variants (same research) → user picks one
+            blog_variants = st.session_state.result.get("blog_variants") or []
+            if len(blog_variants) > 1:
+                choice = st.radio(
+                    "Blog variant",
+                    range(len(blog_variants)),
+                    format_func=lambda i: f"Variant {i + 1}",
+                    horizontal=True,
+                    key=f"blog_variant_{st.session_state.result.get('run_id')}",
+                )
+                st.session_state.result["blog"] = blog_variants[choice]
+
             # Blog content immediately follows image
             st.text_area(
                 "Marketing Blog",
@@ -244,6 +402,19 @@ with col3:
         # ---- LinkedIn section (separate) ----
         st.subheader("💼 LinkedIn Post")
 
+        linkedin_variants = st.session_state.result.get("linkedin_variants") or []
+        if len(linkedin_variants) > 1:
+            choice = st.radio(
+                "LinkedIn variant",
+                range(len(linkedin_variants)),
+                format_func=lambda i: f"Variant {i + 1}",
+                horizontal=True,
+                key=f"linkedin_variant_{st.session_state.result.get('run_id')}",
+                # The queued/sent post is fixed once handed to the outbox
+                disabled=bool(st.session_state.result.get("linkedin_outbox_key")),
+            )
+            st.session_state.result["linkedin"] = linkedin_variants[choice]
+
         st.text_area(
             "LinkedIn Content",
             st.session_state.result["linkedin"],
@@ -252,35 +423,64 @@ with col3:
 
         approved = st.checkbox("I approve this LinkedIn post")
 
+        outbox_key = st.session_state.result.get("linkedin_outbox_key")
+        post_state = get_outbox().status(outbox_key) if outbox_key else None
+
+        if post_state and post_state["status"] == "sent":
+            st.session_state.result["linkedin_posted"] = True
+
         already_posted = st.session_state.result.get("linkedin_posted", False)
 
-        if approved and not already_posted:
-            if st.button("🚀 Post on LinkedIn"):
-                try:
-                    emit_event = lambda s, m: st.session_state.event_queue.put(
-                        ("log", s, m)
-                    )
+        if already_posted:
+            st.success("This LinkedIn post has already been published.")
 
-                    agent = LinkedInPostSubmitAgent()
-                    agent.post(
-                        st.session_state.result["linkedin"],
-                        emit_event,
-                    )
+        elif post_state and get_outbox().is_stalled(post_state):
+            # Worker stuck or gone: stop polling instead of rerunning forever
+            st.warning(
+                f"LinkedIn post has been {post_state['status']} with no progress — "
+                "check your profile before posting again, or reload the page later."
+            )
+
+        elif post_state and post_state["status"] in ("queued", "sending"):
+            outbox_pending = True
+            if post_state["attempts"] and post_state["last_error"]:
+                retry_in = max(0, int(post_state["next_attempt_at"] - time.time()))
+                st.info(
+                    f"⏳ Retrying LinkedIn post (attempt {post_state['attempts']}) "
+                    f"in {retry_in}s — {post_state['last_error']}"
+                )
+            else:
+                st.info("⏳ LinkedIn post queued for publishing...")
+
+        elif post_state and post_state["status"] == "unknown":
+            st.warning(
+                "LinkedIn delivery is uncertain — check your profile before "
+                f"posting again. ({post_state['last_error']})"
+            )
 
-                    st.session_state.result["linkedin_posted"] = True
-                    st.success("Successfully posted on LinkedIn!")
+        else:
+            if post_state and post_state["status"] == "failed":
+                st.error(f"LinkedIn post failed: {post_state['last_error']}")
 
+            retry = bool(post_state and post_state["status"] == "failed")
+            if approved and st.button("🔁 Retry LinkedIn post" if retry else "🚀 Post on LinkedIn"):
+                try:
+                    st.session_state.result["linkedin_outbox_key"] = (
+                        get_outbox().enqueue(st.session_state.result["linkedin"])
+                    )
+                    st.session_state.logs.append(
+                        ("LINKEDIN", "Post queued in LinkedIn outbox")
+                    )
                 except Exception as e:
                     st.error(str(e))
-
-        elif already_posted:
-            st.success("This LinkedIn post has already been published.")
+                else:
+                    st.rerun()
 
     else:
         st.info("No content generated yet.")
 # --------------------------------------------------
 # Poll rerun AFTER render
 # --------------------------------------------------
-if st.session_state.is_running:
+if st.session_state.is_running or outbox_pending:
     time.sleep(0.3)
     st.rerun()
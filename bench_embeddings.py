@@ -0,0 +1,88 @@
+# bench_embeddings.py
+"""
+Parity + throughput check: PyTorch vs ONNX embedding backends.
+
+Embeds every product in data/products.csv with both backends and reports
+  - per-document cosine similarity between the two vectors
+  - top-k overlap of FAISS results for a set of sample queries
+  - documents/second for each backend
+
+Run:
+    python embeddings.py          # export the ONNX model first
+    python bench_embeddings.py [--k 6] [--fp32]
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from embeddings import OnnxEmbeddings
+from rag import get_embeddings, load_csv_documents
+
+SAMPLE_QUERIES = [
+    "Best perfumes under 1000 inr",
+    "Long lasting matte lipstick",
+    "Waterproof mascara for sensitive eyes",
+    "Hydrating serum for dry skin",
+    "Sulphate free shampoo",
+    "Budget friendly body wash",
+    "Top rated eyeshadow palettes",
+    "Lightweight moisturizer for oily skin",
+]
+
+
+def timed_embed(embeddings, texts):
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - start
+
+
+def top_k_ids(doc_vectors, query_vectors, k):
+    index = faiss.IndexFlatIP(doc_vectors.shape[1])
+    index.add(doc_vectors)
+    _, ids = index.search(query_vectors, k)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--fp32", action="store_true", help="Use the non-quantized ONNX model")
+    args = parser.parse_args()
+
+    texts = [d.page_content for d in load_csv_documents()]
+    print(f"Documents: {len(texts)}")
+
+    torch_emb = get_embeddings("torch")
+    onnx_emb = OnnxEmbeddings(quantized=not args.fp32)
+
+    torch_vecs, torch_secs = timed_embed(torch_emb, texts)
+    onnx_vecs, onnx_secs = timed_embed(onnx_emb, texts)
+
+    # Both backends return L2-normalised vectors → dot product == cosine
+    cosine = (torch_vecs * onnx_vecs).sum(axis=1)
+
+    torch_q = np.asarray(torch_emb.embed_documents(SAMPLE_QUERIES), dtype=np.float32)
+    onnx_q = np.asarray(onnx_emb.embed_documents(SAMPLE_QUERIES), dtype=np.float32)
+
+    torch_ids = top_k_ids(torch_vecs, torch_q, args.k)
+    onnx_ids = top_k_ids(onnx_vecs, onnx_q, args.k)
+
+    overlaps = [
+        len(set(a) & set(b)) / args.k
+        for a, b in zip(torch_ids.tolist(), onnx_ids.tolist())
+    ]
+
+    print("\nParity")
+    print(f"  cosine mean={cosine.mean():.4f} min={cosine.min():.4f} p1={np.percentile(cosine, 1):.4f}")
+    print(f"  top-{args.k} overlap mean={np.mean(overlaps):.3f} min={np.min(overlaps):.3f}")
+
+    print("\nThroughput")
+    print(f"  torch: {len(texts) / torch_secs:8.1f} docs/s ({torch_secs:.1f}s)")
+    print(f"  onnx : {len(texts) / onnx_secs:8.1f} docs/s ({onnx_secs:.1f}s)")
+    print(f"  speedup: {torch_secs / onnx_secs:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
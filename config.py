@@ -2,7 +2,31 @@
 
 APP_NAME = "Content Creator Multi-Agent"
 
-MAX_HISTORY = 10
+MAX_HISTORY = 5000          # runs kept in history.db (full-text searchable)
+HISTORY_PAGE_SIZE = 10
+
+# Research pre-warming (prewarm.py) — spends provider quota, off by default
+ENABLE_PREWARM = False
+PREWARM_SEEDS_PATH = "data/prewarm_seeds.txt"  # one topic per line (optional)
+PREWARM_WINDOW_HOURS = (1, 6)       # local off-peak window [start, end)
+PREWARM_INTERVAL_MINUTES = 30
+PREWARM_MAX_TOPICS_PER_CYCLE = 5
+PREWARM_MIN_RUNS = 2                # history topics need this many runs
+PREWARM_TTL_HOURS = 12
+
+# Pipeline → UI events (events.py)
+EVENT_BUFFER_SIZE = 500     # ring buffer per run
+LOG_HISTORY_SIZE = 500      # log lines kept on screen per session
+
+# Structured LLM outputs (structured.py): planner + image prompt
+STRUCTURED_OUTPUT_MODE = "json_object"   # "json_object" | "json_schema" | "off"
+STRUCTURED_MAX_REASKS = 1
+
+# Per-run profiling (profiling.py) — only active when ticked in the UI
+PROFILE_SAMPLE_INTERVAL = 0.01   # seconds between stack samples
+PROFILE_MAX_DEPTH = 64           # frames kept per sampled stack
+PROFILE_TRACE_FRAMES = 10        # tracemalloc traceback depth
+PROFILE_TOP_ALLOCATIONS = 15     # allocation sites reported per stage
 
 ALLOWED_DOMAINS = [
     "beauty",
@@ -19,6 +43,65 @@ LLM_MODEL = "arcee-ai/trinity-mini:free"
 ENABLE_WEB_SEARCH = True
 ENABLE_IMAGE_GEN = True
 ENABLE_LINKEDIN_POST = False
+
+# Blog / LinkedIn variants per run (user picks one in the UI)
+VARIANT_COUNT = 3
+VARIANT_MODE = "n"            # "n" = provider multi-completion, "batch" = concurrent calls
+VARIANT_TEMPERATURE = 0.8     # used only when VARIANT_COUNT > 1
+
+# Embeddings
+# "torch" (sentence-transformers) | "onnx" (onnxruntime, see embeddings.py)
+EMBEDDING_BACKEND = "torch"
+ONNX_MODEL_DIR = "data/onnx_minilm"
+ONNX_QUANTIZED = True
+
+# Retrieval diversity
+ENABLE_DEDUP = True              # collapse near-duplicate variants at index build
+RAG_SEARCH_TYPE = "mmr"          # "similarity" | "mmr"
+MMR_FETCH_K = 30
+MMR_LAMBDA = 0.6                 # 1.0 = pure relevance, 0.0 = max diversity
+
+# Index shards (shards.py): one per category × country, lazily loaded
+ENABLE_INDEX_SHARDS = True
+SHARD_MEMORY_BUDGET_MB = 64
+
+# Retrieval cache (retrieval_cache.py): LRU entries per level
+QUERY_CACHE_SIZE = 1024          # normalised query → embedding
+RESULT_CACHE_SIZE = 4096         # (query, k, filter, index version) → doc ids
+
+# Retrieval service (retrieval_service.py)
+# Empty URL keeps retrieval in-process; set to e.g. "http://127.0.0.1:8765"
+# to share one model + FAISS index across every UI / batch worker on a host.
+RETRIEVAL_SERVICE_URL = ""
+RETRIEVAL_SERVICE_HOST = "127.0.0.1"
+RETRIEVAL_SERVICE_PORT = 8765
+RETRIEVAL_BATCH_WINDOW_MS = 10
+RETRIEVAL_MAX_BATCH = 32
+RETRIEVAL_SERVICE_TIMEOUT = 10
+
+# Outbound rate limits (scheduler.py): requests/min and tokens/min per provider
+PROVIDER_LIMITS = {
+    "openrouter": {"rpm": 20, "tpm": 40000, "completion_tokens": 800},
+    "tavily": {"rpm": 60},
+    "huggingface": {"rpm": 10},
+}
+
+# Expected completion tokens per LLM call, charged to the tokens/min bucket
+# up front and reconciled with the provider's reported usage afterwards
+COMPLETION_TOKENS = {
+    "research": 1200,
+    "blog": 1500,
+    "linkedin": 400,
+    "structured": 200,
+}
+
+# LinkedIn publishing outbox (outbox.py)
+OUTBOX_DB_PATH = "outbox.db"
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_BASE_DELAY = 2            # seconds, doubled per attempt
+OUTBOX_MAX_DELAY = 300
+OUTBOX_REQUEST_TIMEOUT = 15
+
 TAVILY_API_KEY = 
 OPENROUTER_API_KEY =
 HF_API_TOKEN =
@@ -0,0 +1,164 @@
+# dedup.py
+"""
+Offline near-duplicate collapse for the product catalog.
+
+The CSV holds many variants of one product (sizes, packs, shades).
+Products of the same brand, category, subcategory and country are
+clustered when their normalised names match, or when names are similar
+AND their embeddings are close. Each cluster is indexed once, as its
+best-rated (then cheapest) priced member, with the variant count and
+price range added to the document.
+
+Country and subcategory are part of the blocking key because retrieval
+routes / filters on them: a cluster spanning two markets would otherwise
+vanish from one of them when its representative comes from the other.
+"""
+import math
+import re
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+NAME_SIMILARITY = 0.85
+EMBEDDING_SIMILARITY = 0.95
+CLUSTERING_VERSION = 3  # part of the index path; bump when clustering changes
+
+_SIZE_RE = re.compile(
+    r"\b\d+(\.\d+)?\s*(ml|l|g|gm|gms|kg|mg|oz|fl\.?\s*oz|pcs|pc|pieces|count|ct)\b"
+)
+_PACK_RE = re.compile(r"\b(pack|set|combo|box)\s+of\s+\d+\b")
+_NOISE_RE = re.compile(r"[^a-z ]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Strips sizes, pack counts, numbers and punctuation:
+    "CHARLENE SPRAY MIST PERFUME 30 - INTIMATE (PACK OF 2)"
+        → "charlene spray mist perfume intimate"
+    """
+    name = str(name).lower()
+    name = _SIZE_RE.sub(" ", name)
+    name = _PACK_RE.sub(" ", name)
+    name = _NOISE_RE.sub(" ", name)
+    return " ".join(name.split())
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+def cluster_documents(docs: List[Document], vectors: Optional[np.ndarray] = None) -> List[List[int]]:
+    """
+    Returns clusters as lists of document indices.
+    `vectors` must be L2-normalised; without them, name similarity alone decides.
+    """
+    uf = _UnionFind(len(docs))
+    names = [normalize_name(d.metadata["product_name"]) for d in docs]
+
+    # Block by brand + category + subcategory + country: keeps comparisons
+    # small and never merges across the keys retrieval routes / filters on
+    blocks = {}
+    for i, d in enumerate(docs):
+        key = (
+            str(d.metadata["brand"]).lower(),
+            d.metadata["category"],
+            d.metadata["subcategory"],
+            d.metadata["country"],
+        )
+        blocks.setdefault(key, []).append(i)
+
+    for members in blocks.values():
+        for a_pos, a in enumerate(members):
+            for b in members[a_pos + 1:]:
+                if names[a] == names[b]:
+                    uf.union(a, b)
+                    continue
+
+                # Cheap upper bounds first; ratio() is the expensive one
+                matcher = SequenceMatcher(None, names[a], names[b])
+                if (
+                    matcher.real_quick_ratio() < NAME_SIMILARITY
+                    or matcher.quick_ratio() < NAME_SIMILARITY
+                    or matcher.ratio() < NAME_SIMILARITY
+                ):
+                    continue
+
+                if vectors is None or float(vectors[a] @ vectors[b]) >= EMBEDDING_SIMILARITY:
+                    uf.union(a, b)
+
+    clusters = {}
+    for i in range(len(docs)):
+        clusters.setdefault(uf.find(i), []).append(i)
+    return list(clusters.values())
+
+
+def _rating(value) -> float:
+    # Missing / NaN / review counts leaked into the rating column → 0
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return rating if 0 <= rating <= 5 else 0.0
+
+
+def _price(value):
+    # Missing / NaN prices → None (NaN is truthy and breaks min/max)
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(price) else price
+
+
+def _rank(doc: Document):
+    # Priced rows first (an unpriced representative hides the price
+    # range), then best-rated, then cheapest
+    price = _price(doc.metadata.get("price"))
+    return (price is None, -_rating(doc.metadata.get("rating")), price or 0)
+
+
+def dedupe_documents(docs: List[Document], vectors: Optional[np.ndarray] = None):
+    """
+    Collapses near-duplicates.
+    Returns (representative_docs, representative_indices) so callers can
+    reuse already-computed embeddings for the survivors.
+    """
+    kept_docs, kept_idx = [], []
+
+    for cluster in cluster_documents(docs, vectors):
+        best = min(cluster, key=lambda i: _rank(docs[i]))
+        doc = docs[best]
+
+        if len(cluster) > 1:
+            prices = [p for p in (_price(docs[i].metadata.get("price")) for i in cluster) if p is not None]
+            summary = f"Variants: {len(cluster)}"
+            metadata = {**doc.metadata, "variant_count": len(cluster)}
+
+            if prices:
+                summary += f" (price {min(prices):g}–{max(prices):g})"
+                metadata["price_min"] = min(prices)
+                metadata["price_max"] = max(prices)
+
+            doc = Document(
+                page_content=f"{doc.page_content}\n{summary}",
+                metadata=metadata,
+            )
+
+        kept_docs.append(doc)
+        kept_idx.append(best)
+
+    return kept_docs, kept_idx
@@ -0,0 +1,127 @@
+# embeddings.py
+"""
+ONNX Runtime embedding backend.
+
+Runs an exported (optionally int8-quantized) copy of the same
+sentence-transformers model without importing torch. Produces the same
+mean-pooled, L2-normalised vectors as HuggingFaceEmbeddings with
+normalize_embeddings=True.
+
+Export once:
+    python embeddings.py
+"""
+import os
+from typing import List
+
+import numpy as np
+import onnxruntime as ort
+from langchain_core.embeddings import Embeddings
+from tokenizers import Tokenizer
+
+from config import ONNX_MODEL_DIR, ONNX_QUANTIZED
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+MAX_SEQ_LENGTH = 256  # same truncation as all-MiniLM-L6-v2
+
+
+class OnnxEmbeddings(Embeddings):
+    def __init__(
+        self,
+        model_dir: str = ONNX_MODEL_DIR,
+        quantized: bool = ONNX_QUANTIZED,
+        batch_size: int = 64,
+    ):
+        model_file = ONNX_QUANTIZED_FILE if quantized else ONNX_MODEL_FILE
+        model_path = os.path.join(model_dir, model_file)
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"{model_path} not found. Run `python embeddings.py` to export it."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+        self.batch_size = batch_size
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array(
+                [e.type_ids for e in encodings], dtype=np.int64
+            )
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over non-padding tokens, then L2 normalise
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled / norms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+# --------------------------------------------------
+# Export (+ dynamic int8 quantization)
+# --------------------------------------------------
+
+def export_onnx_model(model_name: str, model_dir: str = ONNX_MODEL_DIR, quantize: bool = True):
+    """
+    Exports `model_name` to ONNX with optimum and, optionally, writes a
+    dynamically int8-quantized copy next to it.
+    Export-only dependencies are imported here so serving needs just
+    onnxruntime + tokenizers.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    os.makedirs(model_dir, exist_ok=True)
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+    if quantize:
+        quantize_dynamic(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            os.path.join(model_dir, ONNX_QUANTIZED_FILE),
+            weight_type=QuantType.QInt8,
+        )
+
+    return model_dir
+
+
+if __name__ == "__main__":
+    from rag import EMBEDDING_MODEL_NAME
+
+    print(f"Exported to {export_onnx_model(EMBEDDING_MODEL_NAME)}")
@@ -0,0 +1,99 @@
+# events.py
+"""
+Bounded event channel between a pipeline thread and the Streamlit UI.
+
+- Logs go into a fixed-size ring buffer with sequence numbers; the UI
+  reads only entries newer than the last sequence it has seen.
+- Progress is coalesced to the latest value (never queued).
+- Under load, low-priority log lines are dropped (and counted) before
+  anything else; ERROR / SYSTEM lines are always kept.
+- The pipeline holds only a weak reference, so the channel is freed with
+  its session; a pipeline whose channel is gone stops at its next event.
+"""
+import threading
+import weakref
+from collections import deque
+
+from config import EVENT_BUFFER_SIZE
+
+HIGH_PRIORITY_STAGES = {"ERROR", "SYSTEM"}
+HIGH_WATERMARK = 0.8  # fraction of capacity at which low-priority logs are shed
+
+
+class RunAbandoned(Exception):
+    """Raised in the pipeline thread when its session's channel is gone."""
+
+
+class EventChannel:
+    def __init__(self, capacity: int = EVENT_BUFFER_SIZE):
+        self.capacity = capacity
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+
+        self._progress = None
+        self.result = None
+        self.done = False
+        self.dropped = 0
+
+    # ---------- producer side (pipeline thread) ----------
+
+    def log(self, stage: str, message: str):
+        with self._lock:
+            size = len(self._buffer)
+
+            if stage not in HIGH_PRIORITY_STAGES and size >= self.capacity * HIGH_WATERMARK:
+                self.dropped += 1
+                return
+
+            if size == self.capacity:
+                # Ring buffer overwrites the oldest entry
+                self.dropped += 1
+
+            self._seq += 1
+            self._buffer.append((self._seq, stage, message))
+
+    def set_progress(self, value: int):
+        # Coalesced: only the latest value survives until the UI takes it
+        self._progress = value
+
+    def set_result(self, result: dict):
+        self.result = result
+
+    def close(self):
+        self.done = True
+
+    # ---------- consumer side (UI thread) ----------
+
+    def read_since(self, seq: int):
+        """
+        Returns ([(stage, message), ...], last_seq) for entries after `seq`.
+        Consumed entries are released so a slow UI never holds them twice.
+        """
+        with self._lock:
+            entries = [(s, stage, msg) for s, stage, msg in self._buffer if s > seq]
+            self._buffer.clear()
+            last = entries[-1][0] if entries else seq
+
+        return [(stage, msg) for _, stage, msg in entries], last
+
+    def take_progress(self):
+        """Latest progress since the previous call, or None if unchanged."""
+        value, self._progress = self._progress, None
+        return value
+
+
+def weak_channel(channel: EventChannel):
+    """
+    Returns get() → channel for pipeline threads, holding only a weak
+    reference. get() raises RunAbandoned once the session dropped it.
+    """
+    ref = weakref.ref(channel)
+
+    def get() -> EventChannel:
+        channel = ref()
+        if channel is None:
+            raise RunAbandoned()
+        return channel
+
+    return get
@@ -0,0 +1,353 @@
+# outbox.py
+"""
+Persistent LinkedIn publishing outbox.
+
+Posts are queued in SQLite under an idempotency key and published by a
+background worker over a pooled HTTP session, so the Streamlit script
+thread never blocks on LinkedIn.
+
+Statuses:
+  queued   waiting for (re)send; next_attempt_at holds the backoff time
+  sending  request in flight (claimed by exactly one worker process)
+  sent     published — the key can never be sent again
+  failed   permanent error or retries exhausted
+  unknown  the request may have reached LinkedIn (read timeout / crash
+           mid-send); never retried automatically to avoid double posts
+"""
+import hashlib
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from config import (
+    LINKEDIN_ACCESS_TOKEN,
+    LINKEDIN_UGC_URL,
+    LINKEDIN_USER_ID,
+    OUTBOX_BASE_DELAY,
+    OUTBOX_DB_PATH,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_MAX_DELAY,
+    OUTBOX_REQUEST_TIMEOUT,
+)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger("outbox")
+
+
+# --------------------------------------------------
+# LinkedIn UGC request
+# --------------------------------------------------
+
+def linkedin_headers(access_token: str) -> dict:
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+        "X-Restli-Protocol-Version": "2.0.0",
+    }
+
+
+def linkedin_payload(user_id: str, text: str) -> dict:
+    return {
+        "author": f"urn:li:person:{user_id}",
+        "lifecycleState": "PUBLISHED",
+        "specificContent": {
+            "com.linkedin.ugc.ShareContent": {
+                "shareCommentary": {
+                    "text": text
+                },
+                "shareMediaCategory": "NONE",
+            }
+        },
+        "visibility": {
+            "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
+        },
+    }
+
+
+def idempotency_key(user_id: str, text: str) -> str:
+    return hashlib.sha256(f"{user_id}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _never_sent(error: requests.ConnectionError) -> bool:
+    """
+    True only when the TCP/TLS connection could not be established
+    (DNS failure, refused, connect timeout) — nothing reached LinkedIn.
+    """
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+# --------------------------------------------------
+# Outbox
+# --------------------------------------------------
+
+class LinkedInOutbox:
+    def __init__(
+        self,
+        db_path: str = OUTBOX_DB_PATH,
+        ugc_url: str = LINKEDIN_UGC_URL,
+        access_token: str = LINKEDIN_ACCESS_TOKEN,
+        user_id: str = LINKEDIN_USER_ID,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        base_delay: float = OUTBOX_BASE_DELAY,
+        max_delay: float = OUTBOX_MAX_DELAY,
+        clock=time.time,
+    ):
+        if not access_token:
+            raise EnvironmentError("LinkedIn access token not provided")
+
+        if not user_id:
+            raise EnvironmentError("LinkedIn user_id (sub) not provided")
+
+        self.db_path = db_path
+        self.ugc_url = ugc_url
+        self.access_token = access_token
+        self.user_id = user_id
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+
+        # One pooled, keep-alive session for every publish
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        self._init_db()
+
+    # ---------- storage ----------
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    response TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            # A crash mid-send leaves rows in "sending": we cannot know
+            # whether LinkedIn accepted them, so never resend blindly.
+            # Recent rows may still be in flight in another server process.
+            conn.execute(
+                "UPDATE outbox SET status = 'unknown', "
+                "last_error = 'Interrupted while sending; verify on LinkedIn' "
+                "WHERE status = 'sending' AND updated_at < ?",
+                (self.clock() - 2 * OUTBOX_REQUEST_TIMEOUT,),
+            )
+
+    def _update(self, key: str, **fields):
+        fields["updated_at"] = self.clock()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"UPDATE outbox SET {columns} WHERE key = ?",
+                (*fields.values(), key),
+            )
+
+    # ---------- public API ----------
+
+    def enqueue(self, text: str) -> str:
+        """
+        Queues `text` once. Re-enqueueing the same text (e.g. after a
+        Streamlit rerun) returns the existing key without a second post.
+        A `failed` post is an explicit user retry: it is queued again with
+        a fresh attempt budget.
+        """
+        key = idempotency_key(self.user_id, text)
+        now = self.clock()
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(key, text, status, attempts, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', 0, ?, ?, ?)",
+                (key, text, now, now, now),
+            )
+            conn.execute(
+                "UPDATE outbox SET status = 'queued', attempts = 0, "
+                "next_attempt_at = ?, last_error = NULL, updated_at = ? "
+                "WHERE key = ? AND status = 'failed'",
+                (now, now, key),
+            )
+
+        self._wake.set()
+        return key
+
+    def status(self, key: str):
+        with self._lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT key, status, attempts, next_attempt_at, last_error, response, updated_at "
+                "FROM outbox WHERE key = ?",
+                (key,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def key_for(self, text: str) -> str:
+        return idempotency_key(self.user_id, text)
+
+    def is_stalled(self, state: dict) -> bool:
+        """
+        True when a status() row has made no progress for longer than any
+        healthy send or retry would take (worker stuck or gone), so the
+        UI should stop waiting on it.
+        """
+        grace = 2 * OUTBOX_REQUEST_TIMEOUT
+        now = self.clock()
+        if state["status"] == "sending":
+            return now - state["updated_at"] > grace
+        if state["status"] == "queued":
+            return now - state["next_attempt_at"] > grace
+        return False
+
+    # ---------- worker ----------
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def _loop(self):
+        while True:
+            try:
+                self.process_once()
+            except Exception:
+                # e.g. "database is locked" with several server processes:
+                # keep the worker alive, the row is picked up next round
+                logger.exception("Outbox worker iteration failed")
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
+
+    def process_once(self) -> int:
+        """
+        Publishes every due item once. Returns how many were attempted.
+
+        Every Streamlit server process runs its own worker on the same
+        database, so a row is claimed (queued → sending) atomically first
+        and only the worker whose claim succeeded publishes it.
+        """
+        now = self.clock()
+        with self._lock, self._connect() as conn:
+            due = conn.execute(
+                "SELECT key, text, attempts FROM outbox "
+                "WHERE status = 'queued' AND next_attempt_at <= ? "
+                "ORDER BY created_at",
+                (now,),
+            ).fetchall()
+
+        attempted = 0
+        for key, text, attempts in due:
+            if self._claim(key, attempts + 1):
+                self._publish(key, text, attempts + 1)
+                attempted += 1
+
+        return attempted
+
+    def _claim(self, key: str, attempts: int) -> bool:
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE outbox SET status = 'sending', attempts = ?, updated_at = ? "
+                "WHERE key = ? AND status = 'queued'",
+                (attempts, self.clock(), key),
+            )
+            return cursor.rowcount == 1
+
+    def _backoff(self, attempts: int, retry_after=None) -> float:
+        if retry_after is not None:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _retry_or_fail(self, key: str, attempts: int, error: str, retry_after=None):
+        if attempts >= self.max_attempts:
+            self._update(key, status="failed", attempts=attempts, last_error=error)
+        else:
+            self._update(
+                key,
+                status="queued",
+                attempts=attempts,
+                last_error=error,
+                next_attempt_at=self.clock() + self._backoff(attempts, retry_after),
+            )
+
+    def _publish(self, key: str, text: str, attempts: int):
+        try:
+            response = self.session.post(
+                self.ugc_url,
+                headers=linkedin_headers(self.access_token),
+                json=linkedin_payload(self.user_id, text),
+                timeout=OUTBOX_REQUEST_TIMEOUT,
+            )
+        except requests.ConnectTimeout as e:
+            # Request never reached LinkedIn → safe to retry
+            self._retry_or_fail(key, attempts, f"Connection error: {e}")
+            return
+        except requests.ConnectionError as e:
+            if _never_sent(e):
+                self._retry_or_fail(key, attempts, f"Connection error: {e}")
+            else:
+                # Reset / disconnect after sending: the post may be live
+                self._update(key, status="unknown", last_error=f"Uncertain delivery: {e}")
+            return
+        except requests.RequestException as e:
+            # e.g. read timeout: the post may already be live
+            self._update(key, status="unknown", last_error=f"Uncertain delivery: {e}")
+            return
+
+        if response.status_code in (200, 201):
+            self._update(key, status="sent", last_error=None, response=response.text)
+        elif response.status_code in RETRYABLE_STATUS:
+            self._retry_or_fail(
+                key,
+                attempts,
+                f"LinkedIn API error {response.status_code}: {response.text[:500]}",
+                retry_after=response.headers.get("Retry-After"),
+            )
+        else:
+            self._update(
+                key,
+                status="failed",
+                last_error=f"LinkedIn API error {response.status_code}: {response.text[:500]}",
+            )
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> LinkedInOutbox:
+    """
+    Process-wide outbox with its worker started.
+    """
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = LinkedInOutbox().start()
+        return _outbox
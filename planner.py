@@ -1,8 +1,8 @@
 # planner.py
-import json
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from config import LLM_MODEL, OPENROUTER_API_KEY
+from structured import PLAN_SCHEMA, StructuredOutputError, invoke_structured
 
 def run_query_planner(query: str, log=None) -> dict:
     """
@@ -12,6 +12,7 @@ def run_query_planner(query: str, log=None) -> dict:
         allowed: bool,
         top_k: int,
         category: str,
+        country: str,
         intent: str
       }
     """
@@ -36,7 +37,8 @@ def run_query_planner(query: str, log=None) -> dict:
         1. Is the query related to beauty, cosmetic, perfume, fragrance, or body-care products?
         2. How many products should be retrieved? (default 6)
         3. What is the main product category?
-        4. What is the user intent?
+        4. Which market does the user mean? (India, USA, or any if not stated)
+        5. What is the user intent?
 
         Rules:
         - If user asks "top N", use N
@@ -47,23 +49,26 @@ def run_query_planner(query: str, log=None) -> dict:
         {{
         "allowed": true or false,
         "top_k": number,
-        "category": "perfume | cosmetic | bodycare | mixed | unknown",
+        "category": "perfume | cosmetic | skincare | haircare | bodycare | mixed | unknown",
+        "country": "India | USA | any",
         "intent": "list | comparison | recommendation | informational"
         }}
         """
     )
 
 
-    response = (prompt | llm).invoke({"query": query}).content.strip()
+    prompt_value = prompt.invoke({"query": query})
 
     try:
-        plan = json.loads(response)
-    except Exception:
-        # Fail safe
+        plan = invoke_structured(llm, prompt_value, PLAN_SCHEMA, "query_plan", log, "RESEARCH")
+    except StructuredOutputError as e:
+        # Fail safe (after local repair and one re-ask)
+        log("ERROR", f"Planner output unusable, rejecting query: {e}")
         plan = {
             "allowed": False,
             "top_k": 5,
             "category": "unknown",
+            "country": "any",
             "intent": "unknown",
         }
 
@@ -72,6 +77,7 @@ def run_query_planner(query: str, log=None) -> dict:
         f"Planner output → allowed={plan['allowed']}, "
         f"top_k={plan['top_k']}, "
         f"category={plan['category']}, "
+        f"country={plan.get('country', 'any')}, "
         f"intent={plan['intent']}",
     )
 
@@ -0,0 +1,158 @@
+# prewarm.py
+"""
+Background pre-warming of research for popular / trending topics.
+
+During the off-peak window, topics mined from history (asked at least
+PREWARM_MIN_RUNS times) plus the operator's seed list are run through
+the planner, catalog retrieval, Tavily and ResearchAgent synthesis. The
+stages are stored with a timestamp; ContentOrchestrator then starts
+fresh runs for those topics at BlogWriterAgent.
+
+The catalog stage is exactly what the live path's retrieval step
+produces (plan_and_retrieve), so no separate vector search is warmed.
+Progress goes to the `prewarm` logger, or to a log(stage, msg) callback.
+
+Budgets keep live traffic first:
+  - at most PREWARM_MAX_TOPICS_PER_CYCLE topics per cycle, one at a time
+  - every provider call runs at PRIORITY_BULK in the rate-limit scheduler
+  - a cycle stops as soon as interactive calls are queued on any provider
+    or the off-peak window closes
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from agents import ResearchAgent
+from config import (
+    PREWARM_INTERVAL_MINUTES,
+    PREWARM_MAX_TOPICS_PER_CYCLE,
+    PREWARM_MIN_RUNS,
+    PREWARM_SEEDS_PATH,
+    PREWARM_WINDOW_HOURS,
+)
+from scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, request_context, scheduler
+from storage import load_prewarmed, popular_topics, save_prewarmed, topic_key
+
+
+logger = logging.getLogger("prewarm")
+
+
+def _log(stage: str, message: str):
+    logger.log(logging.ERROR if stage == "ERROR" else logging.INFO, f"[{stage}] {message}")
+
+
+class PrewarmScheduler:
+    def __init__(
+        self,
+        seeds_path: str = PREWARM_SEEDS_PATH,
+        window_hours=PREWARM_WINDOW_HOURS,
+        interval_minutes: float = PREWARM_INTERVAL_MINUTES,
+        max_topics: int = PREWARM_MAX_TOPICS_PER_CYCLE,
+        min_runs: int = PREWARM_MIN_RUNS,
+        clock=datetime.now,
+        log=_log,
+    ):
+        self.seeds_path = seeds_path
+        self.window_hours = window_hours
+        self.interval = interval_minutes * 60
+        self.max_topics = max_topics
+        self.min_runs = min_runs
+        self.clock = clock
+        self.log = log
+        self.research_agent = ResearchAgent()
+        self._thread = None
+
+    # ---------- policy ----------
+
+    def in_window(self) -> bool:
+        start, end = self.window_hours
+        hour = self.clock().hour
+        # Windows may wrap midnight, e.g. (22, 5)
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def live_traffic_waiting(self) -> bool:
+        return any(
+            m["queued_by_priority"].get(PRIORITY_INTERACTIVE, 0)
+            for m in scheduler.metrics().values()
+        )
+
+    def seed_topics(self):
+        if not os.path.exists(self.seeds_path):
+            return []
+        with open(self.seeds_path, "r") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    def candidates(self):
+        """
+        Seeds first, then popular history topics; de-duplicated and
+        skipping anything that is still fresh.
+        """
+        seen, topics = set(), []
+        for topic in self.seed_topics() + popular_topics(self.max_topics * 4, self.min_runs):
+            key = topic_key(topic)
+            if key in seen or load_prewarmed(topic):
+                continue
+            seen.add(key)
+            topics.append(topic)
+        return topics[: self.max_topics]
+
+    # ---------- work ----------
+
+    def warm(self, topic: str):
+        stages = self.research_agent.run_stages(topic, self.log)
+        save_prewarmed(topic, stages)
+
+    def run_cycle(self) -> int:
+        warmed = 0
+
+        with request_context(PRIORITY_BULK, "prewarm"):
+            for topic in self.candidates():
+                if not self.in_window() or self.live_traffic_waiting():
+                    self.log("SYSTEM", "Yielding to live traffic / outside window")
+                    break
+
+                try:
+                    self.log("SYSTEM", f"Pre-warming: {topic}")
+                    self.warm(topic)
+                    warmed += 1
+                except Exception as e:
+                    # Not allowed by the planner, provider errors, ... → skip
+                    self.log("ERROR", f"{topic}: {e}")
+
+        return warmed
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def _loop(self):
+        while True:
+            if self.in_window():
+                self.run_cycle()
+            time.sleep(self.interval)
+
+
+_prewarm = None
+_prewarm_lock = threading.Lock()
+
+
+def get_prewarm_scheduler() -> PrewarmScheduler:
+    """
+    Process-wide pre-warm scheduler with its loop started.
+    """
+    global _prewarm
+    with _prewarm_lock:
+        if _prewarm is None:
+            _prewarm = PrewarmScheduler().start()
+        return _prewarm
+
+
+if __name__ == "__main__":
+    # One cycle now, ignoring the off-peak window (e.g. from cron)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    runner = PrewarmScheduler(window_hours=(0, 24))
+    print(f"Pre-warmed {runner.run_cycle()} topics")
@@ -0,0 +1,277 @@
+# profiling.py
+"""
+On-demand per-run profiling (app.py "Profile this run").
+
+  CPU:    a sampler thread reads the stacks of the pipeline thread and of
+          any worker thread it starts (tagged with track_thread()) via
+          sys._current_frames() every PROFILE_SAMPLE_INTERVAL seconds and
+          aggregates collapsed stacks ("thread;outer;inner;leaf count") for
+          flamegraph.pl / speedscope. Samples are wall-clock, so network and
+          rate-limit waits show up too. time_split breaks the pipeline's
+          wall time into local / network / rate_limit / waiting / profiler;
+          while the pipeline thread is blocked on its workers (futures,
+          joins), the tick is attributed to what the workers are doing.
+  Memory: tracemalloc snapshots at every stage boundary (RESEARCH → BLOG →
+          ...) with the top allocation sites grown during that stage.
+
+Nothing is started unless profiling is switched on; track_thread() is a
+no-op outside a profiled run. tracemalloc is process-wide: it is
+reference-counted across concurrent profiled runs, and allocations from
+other threads during the run are included.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import PROFILE_MAX_DEPTH, PROFILE_SAMPLE_INTERVAL, PROFILE_TOP_ALLOCATIONS, PROFILE_TRACE_FRAMES
+
+# Stack frames that mean "waiting", not local work
+NETWORK_FILES = ("socket.py", "ssl.py", "selectors.py", os.path.join("http", "client.py"))
+RATE_LIMIT_FILES = ("scheduler.py",)
+OWN_FILES = ("tracemalloc.py", "profiling.py")
+# Innermost frames of a thread blocked on another thread (future.result(),
+# executor shutdown, Condition.wait)
+WAIT_FRAMES = {"wait", "join", "_wait_for_tstate_lock", "result", "as_completed"}
+WAIT_FILES = ("threading.py", os.path.join("concurrent", "futures", "_base.py"))
+
+# Kind precedence when the pipeline thread waits on several workers
+WORKER_PRECEDENCE = ["local", "network", "rate_limit"]
+
+_active = ContextVar("run_profiler", default=None)
+
+# tracemalloc is process-wide: started by the first profiled run, stopped
+# by the last one (unless something else had already started it)
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_owned = False
+
+
+def _trace_acquire():
+    global _trace_users, _trace_owned
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACE_FRAMES)
+            _trace_owned = True
+        _trace_users += 1
+
+
+def _trace_release():
+    global _trace_users, _trace_owned
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_owned:
+            tracemalloc.stop()
+            _trace_owned = False
+
+
+@contextmanager
+def track_thread():
+    """
+    Marks the calling thread as part of the current profiled run, if any.
+    Use inside worker threads that run with the pipeline's context
+    (contextvars.copy_context().run).
+    """
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+
+    ident = threading.get_ident()
+    profiler.threads[ident] = "worker"
+    try:
+        yield
+    finally:
+        profiler.threads.pop(ident, None)
+
+
+def _frame_label(code) -> str:
+    # ';' separates frames in collapsed format
+    name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ":")
+
+
+def _classify(codes) -> str:
+    files = [c.co_filename for c in codes]
+    if any(f == __file__ for f in files):
+        return "profiler"  # stage-boundary snapshots
+    if any(f.endswith(NETWORK_FILES) for f in files):
+        return "network"
+    if any(f.endswith(RATE_LIMIT_FILES) and c.co_name == "acquire" for f, c in zip(files, codes)):
+        return "rate_limit"
+    if files[-1].endswith(WAIT_FILES) and codes[-1].co_name in WAIT_FRAMES:
+        return "waiting"
+    return "local"
+
+
+def _top_sites(stats, limit: int):
+    # Skip the profiler's own bookkeeping (filtering sites is far cheaper
+    # than Snapshot.filter_traces on large snapshots)
+    stats = [s for s in stats if not s.traceback[0].filename.endswith(OWN_FILES)]
+    return [
+        {
+            "site": f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+            "size_kb": round(getattr(s, "size_diff", s.size) / 1024, 1),
+            "count": getattr(s, "count_diff", s.count),
+        }
+        for s in stats[:limit]
+    ]
+
+
+class RunProfiler:
+    def __init__(
+        self,
+        interval: float = PROFILE_SAMPLE_INTERVAL,
+        top_n: int = PROFILE_TOP_ALLOCATIONS,
+        max_depth: int = PROFILE_MAX_DEPTH,
+    ):
+        self.interval = interval
+        self.top_n = top_n
+        self.max_depth = max_depth
+
+        self.stacks = Counter()
+        self.kinds = Counter()
+        self.stages = []
+        self.result = None
+
+        self.threads = {}  # ident → "pipeline" | "worker"
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._context_token = None
+        self._stage = None
+        self._snapshot = None
+        self._started = None
+
+    # ---------- lifecycle ----------
+
+    def start(self, thread_id: int = None):
+        """
+        Profiles `thread_id` (default: the calling thread) and the workers
+        it tags with track_thread().
+        """
+        self._thread_id = thread_id or threading.get_ident()
+        self.threads[self._thread_id] = "pipeline"
+        self._context_token = _active.set(self)
+        self._started = time.perf_counter()
+
+        _trace_acquire()
+        self._snapshot = tracemalloc.take_snapshot()
+
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self) -> dict:
+        """
+        Stops sampling and returns the profile. Safe to call twice.
+        """
+        if self.result is not None:
+            return self.result
+
+        self._stop.set()
+        self._sampler.join()
+
+        try:
+            _active.reset(self._context_token)
+        except ValueError:
+            pass  # stopped from another context
+
+        self.mark("END")
+        final = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        current, peak = tracemalloc.get_traced_memory()
+        _trace_release()
+
+        ticks = sum(self.kinds.values())
+        self.result = {
+            "duration_s": round(time.perf_counter() - self._started, 3),
+            "interval_s": self.interval,
+            "samples": ticks,
+            "thread_samples": sum(self.stacks.values()),
+            "time_split": {
+                kind: round(count / ticks, 3) for kind, count in self.kinds.items()
+            } if ticks else {},
+            "collapsed": "\n".join(
+                f"{stack} {count}" for stack, count in self.stacks.most_common()
+            ),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+            "current_mb": round(current / 1024 / 1024, 2),
+            "stages": self.stages,
+            "top_allocations": _top_sites(final.statistics("lineno"), self.top_n) if final else [],
+        }
+        return self.result
+
+    # ---------- stage boundaries ----------
+
+    def mark(self, stage: str):
+        """
+        Called with every log stage; snapshots memory when the stage changes.
+        """
+        if stage == self._stage or self.result is not None:
+            return
+
+        if self._stage is not None and self._snapshot is not None:
+            if not tracemalloc.is_tracing():
+                # Stopped outside the profiler: skip memory, keep running
+                self._snapshot = None
+                self._stage = stage
+                return
+
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            grown = snapshot.compare_to(self._snapshot, "lineno")
+            self.stages.append(
+                {
+                    "stage": self._stage,
+                    "ended_at_s": round(time.perf_counter() - self._started, 3),
+                    "current_mb": round(current / 1024 / 1024, 2),
+                    "peak_mb": round(peak / 1024 / 1024, 2),
+                    "top_growth": _top_sites(
+                        [s for s in grown if s.size_diff > 0], self.top_n
+                    ),
+                }
+            )
+            self._snapshot = snapshot
+
+        self._stage = stage
+
+    # ---------- sampling ----------
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            worker_kinds = set()
+            pipeline_kind = None
+
+            for ident, role in list(self.threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+
+                codes = []
+                while frame is not None and len(codes) < self.max_depth:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+
+                self.stacks[";".join([role] + [_frame_label(c) for c in codes])] += 1
+
+                kind = _classify(codes)
+                if role == "pipeline":
+                    pipeline_kind = kind
+                else:
+                    worker_kinds.add(kind)
+
+            if pipeline_kind is None:
+                continue
+
+            # Pipeline blocked on its workers → count what they are doing
+            if pipeline_kind == "waiting":
+                pipeline_kind = next(
+                    (k for k in WORKER_PRECEDENCE if k in worker_kinds), "waiting"
+                )
+            self.kinds[pipeline_kind] += 1
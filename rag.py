@@ -1,20 +1,46 @@
 # rag.py
 import os
+from operator import itemgetter
+import numpy as np
 import pandas as pd
 from typing import List
 
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
 import streamlit as st
-from config import ALLOWED_DOMAINS, LLM_MODEL, OPENROUTER_API_KEY
+from analytics import format_insights
+from config import (
+    ALLOWED_DOMAINS,
+    EMBEDDING_BACKEND,
+    ENABLE_DEDUP,
+    ENABLE_INDEX_SHARDS,
+    LLM_MODEL,
+    QUERY_CACHE_SIZE,
+    RESULT_CACHE_SIZE,
+    MMR_FETCH_K,
+    MMR_LAMBDA,
+    OPENROUTER_API_KEY,
+    RAG_SEARCH_TYPE,
+    RETRIEVAL_SERVICE_URL,
+    SHARD_MEMORY_BUDGET_MB,
+)
+from dedup import CLUSTERING_VERSION, dedupe_documents
 from planner import run_query_planner
+from retrieval_cache import RetrievalCache
+from shards import ShardManager
 
 DATA_PATH = "data/products.csv"
-INDEX_PATH = "data/faiss_index"
+# Each embedding backend / dedup setting gets its own index so vectors are never mixed
+INDEX_PATH = (
+    "data/faiss_index"
+    + ("" if EMBEDDING_BACKEND == "torch" else f"_{EMBEDDING_BACKEND}")
+    + (f"_dedup{CLUSTERING_VERSION}" if ENABLE_DEDUP else "")
+)
+
+SHARD_DIR = INDEX_PATH.replace("faiss_index", "faiss_shards")
 
 # Choose a strong, production-safe model
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
@@ -28,7 +54,7 @@ def load_csv_documents() -> List[Document]:
     df = pd.read_csv(DATA_PATH)
 
     docs: List[Document] = []
-    for _, row in df.iterrows():
+    for idx, row in df.iterrows():
         content = f"""
 Product Name: {row['product_name']}
 Brand: {row['brand']}
@@ -43,10 +69,12 @@ Rating: {row['rating']}
             Document(
                 page_content=content,
                 metadata={
+                    "doc_id": str(idx),
                     "product_name": row["product_name"],
                     "brand": row["brand"],
                     "category": row["category"],
                     "subcategory": row["subcategory"],
+                    "country": row["country"],
                     "price": row["price"],
                     "rating": row["rating"],
                 },
@@ -59,15 +87,54 @@ Rating: {row['rating']}
 # Vector Store (Sentence Transformers + FAISS)
 # --------------------------------------------------
 
-@st.cache_resource(show_spinner="Loading vector store...")
-def get_vectorstore():
+def get_embeddings(backend: str = EMBEDDING_BACKEND):
+    """
+    "torch" → HuggingFaceEmbeddings on PyTorch CPU
+    "onnx"  → OnnxEmbeddings on onnxruntime (see embeddings.py)
+    Imports are local so the ONNX path never loads torch.
+    """
+    if backend == "onnx":
+        from embeddings import OnnxEmbeddings
 
-    embeddings = HuggingFaceEmbeddings(
+        return OnnxEmbeddings()
+
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
         model_name=EMBEDDING_MODEL_NAME,
         model_kwargs={"device": "cpu"},
         encode_kwargs={"normalize_embeddings": True},
     )
 
+
+def prepare_documents(embeddings):
+    """
+    Catalog documents + their float32 embeddings (embedded once),
+    with near-duplicates collapsed when ENABLE_DEDUP is on.
+    """
+    docs = load_csv_documents()
+    vectors = np.asarray(
+        embeddings.embed_documents([d.page_content for d in docs]),
+        dtype=np.float32,
+    )
+
+    if ENABLE_DEDUP:
+        docs, keep = dedupe_documents(docs, vectors)
+        vectors = vectors[keep]
+
+    return docs, vectors
+
+
+def build_vectorstore(embeddings=None):
+    """
+    Loads the persisted FAISS index (or builds it from the CSV).
+    Streamlit-free so retrieval_service.py can own it out of process.
+    """
+    embeddings = embeddings or get_embeddings()
+
     if os.path.exists(INDEX_PATH):
         return FAISS.load_local(
             INDEX_PATH,
@@ -75,30 +142,169 @@ def get_vectorstore():
             allow_dangerous_deserialization=True,
         )
 
-    docs = load_csv_documents()
-    vectorstore = FAISS.from_documents(docs, embeddings)
+    docs, vectors = prepare_documents(embeddings)
+    vectorstore = FAISS.from_embeddings(
+        [(d.page_content, v.tolist()) for d, v in zip(docs, vectors)],
+        embeddings,
+        metadatas=[d.metadata for d in docs],
+        ids=[d.metadata["doc_id"] for d in docs],
+    )
+
     vectorstore.save_local(INDEX_PATH)
 
     return vectorstore
 
 
+@st.cache_resource(show_spinner="Loading vector store...")
+def get_vectorstore():
+    return build_vectorstore()
+
+
+@st.cache_resource(show_spinner="Loading index shards...")
+def get_shard_manager():
+    return build_shard_manager()
+
+
+def search_kwargs(top_k: int, search_type: str = RAG_SEARCH_TYPE) -> dict:
+    kwargs = {"k": top_k}
+    if search_type == "mmr":
+        kwargs["fetch_k"] = max(MMR_FETCH_K, top_k)
+        kwargs["lambda_mult"] = MMR_LAMBDA
+    return kwargs
+
+
+# --------------------------------------------------
+# Cached search (query embedding + top-k result ids)
+# --------------------------------------------------
+
+retrieval_cache = RetrievalCache(QUERY_CACHE_SIZE, RESULT_CACHE_SIZE)
+
+
+def index_version():
+    # Rebuilding the index rewrites index.faiss → new mtime → cache reset
+    return os.stat(os.path.join(INDEX_PATH, "index.faiss")).st_mtime_ns
+
+
+def search_vectorstore(vectorstore, vector, k: int, filter=None, search_type: str = RAG_SEARCH_TYPE):
+    if search_type == "mmr":
+        return vectorstore.max_marginal_relevance_search_by_vector(
+            vector, filter=filter, **search_kwargs(k, "mmr")
+        )
+    return vectorstore.similarity_search_by_vector(vector, k=k, filter=filter)
+
+
+def cached_search(
+    vectorstore,
+    query: str,
+    k: int,
+    embed_fn=None,
+    filter=None,
+    search_type: str = RAG_SEARCH_TYPE,
+    cache: RetrievalCache = retrieval_cache,
+):
+    """
+    Popular queries skip both the embedding model and the FAISS search.
+    `embed_fn` defaults to the store's own embed_query (the retrieval
+    service passes its micro-batcher instead).
+    """
+    return cache.search(
+        query,
+        k,
+        index_version(),
+        embed_fn=embed_fn or vectorstore.embeddings.embed_query,
+        search_fn=lambda vector: search_vectorstore(
+            vectorstore, vector, k, filter=filter, search_type=search_type
+        ),
+        resolve_fn=lambda doc_ids: [vectorstore.docstore.search(i) for i in doc_ids],
+        filter=filter,
+        search_type=search_type,
+    )
+
+
+def build_shard_manager(embeddings=None):
+    return ShardManager(
+        SHARD_DIR,
+        embeddings or get_embeddings(),
+        prepare_documents,
+        SHARD_MEMORY_BUDGET_MB,
+    )
+
+
+def sharded_search(
+    query: str,
+    k: int,
+    category: str = "unknown",
+    country: str = "any",
+    manager: ShardManager = None,
+    embed_fn=None,
+):
+    """
+    Searches only the shards the planner's category/country name
+    ("mixed"/"unknown" fan out to all of them and merge).
+    The retrieval service passes its own manager and micro-batcher.
+    """
+    manager = manager or get_shard_manager()
+    keys, filter = manager.route(category, country)
+
+    return retrieval_cache.search(
+        query,
+        k,
+        manager.version,
+        embed_fn=embed_fn or manager.embeddings.embed_query,
+        search_fn=lambda vector: manager.search(
+            vector, keys, k, filter=filter, search_type=RAG_SEARCH_TYPE
+        ),
+        resolve_fn=manager.resolve,
+        filter=filter,
+        search_type=RAG_SEARCH_TYPE,
+        scope=keys,
+    )
+
+
+def get_retriever(top_k: int, category: str = "unknown", country: str = "any"):
+    """
+    In-process cached FAISS search (sharded when ENABLE_INDEX_SHARDS),
+    or a thin client of the shared retrieval service when
+    RETRIEVAL_SERVICE_URL is configured.
+    RAG_SEARCH_TYPE="mmr" diversifies the top_k results.
+    """
+    if RETRIEVAL_SERVICE_URL:
+        from retrieval_service import remote_search
+
+        # The service routes shards itself (when it runs with
+        # ENABLE_INDEX_SHARDS) from the planner's category/country
+        return RunnableLambda(
+            lambda query: remote_search(
+                query,
+                top_k,
+                search_type=RAG_SEARCH_TYPE,
+                category=category,
+                country=country,
+            )
+        )
+
+    if ENABLE_INDEX_SHARDS:
+        return RunnableLambda(
+            lambda query: sharded_search(query, top_k, category, country)
+        )
+
+    return RunnableLambda(
+        lambda query: cached_search(get_vectorstore(), query, top_k)
+    )
+
 
 # --------------------------------------------------
 # LCEL RAG Chain
 # --------------------------------------------------
 
 @st.cache_resource(show_spinner="Initializing RAG chain...")
-def get_rag_chain(top_k: int):
+def get_rag_chain(top_k: int, category: str = "unknown", country: str = "any"):
     """
     Builds a RAG chain with dynamic top_k.
-    Cached per top_k value.
+    Cached per (top_k, category, country) — the latter two route shards.
     """
 
-    vectorstore = get_vectorstore()
-
-    retriever = vectorstore.as_retriever(
-        search_kwargs={"k": top_k}
-    )
+    retriever = get_retriever(top_k, category, country)
 
     llm = ChatOpenAI(
         model=LLM_MODEL,
@@ -114,12 +320,15 @@ def get_rag_chain(top_k: int):
         Use ONLY the following catalog data:
         {context}
 
+        Precomputed catalog analytics (exact — quote, do not recompute):
+        {insights}
+
         User topic:
         {question}
 
         TASK:
         - Identify relevant products
-        - Compare pricing and ratings
+        - Compare pricing and ratings using the analytics figures
         - Highlight consumer value
         - Avoid medical or ingredient claims
         - Stay marketing-safe
@@ -127,7 +336,11 @@ def get_rag_chain(top_k: int):
     )
 #Chain retriever, promp and llm together
     return (
-        {"context": retriever, "question": RunnablePassthrough()}
+        {
+            "context": itemgetter("question") | retriever,
+            "question": itemgetter("question"),
+            "insights": itemgetter("insights"),
+        }
         | prompt
         | llm
     )
@@ -138,6 +351,14 @@ def get_rag_chain(top_k: int):
 # --------------------------------------------------
 
 def run_rag(query: str, log=None) -> str:
+    return plan_and_retrieve(query, log)["catalog"]
+
+
+def plan_and_retrieve(query: str, log=None) -> dict:
+    """
+    Planner + catalog research, returned together so pre-warming can
+    store the plan alongside the catalog context.
+    """
     # ----------------------------------
     # 1. Run semantic planner
     # ----------------------------------
@@ -152,16 +373,25 @@ def run_rag(query: str, log=None) -> str:
 
     log("RESEARCH", f"Planner decided top_k={top_k}")
 
+    insights = format_insights(plan["category"])
+    log("RESEARCH", f"Loaded precomputed catalog analytics for {plan['category']}")
+
     # ----------------------------------
     # 2. Get RAG chain (cached)
     # ----------------------------------
-    chain = get_rag_chain(top_k)
+    country = plan.get("country", "any")
+
+    if ENABLE_INDEX_SHARDS and not RETRIEVAL_SERVICE_URL:
+        keys, _ = get_shard_manager().route(plan["category"], country)
+        log("RESEARCH", f"Routing retrieval to shards: {', '.join(keys)}")
+
+    chain = get_rag_chain(top_k, plan["category"], country)
 
     # ----------------------------------
     # 3. Invoke chain (UNCHANGED)
     # ----------------------------------
-    #response = chain.invoke(query)
+    #response = chain.invoke({"question": query, "insights": insights})
 
-    #return response.content
-    return ""
+    #return {"plan": plan, "catalog": response.content}
+    return {"plan": plan, "catalog": insights}
 
@@ -0,0 +1,129 @@
+# retrieval_cache.py
+"""
+Two-level LRU cache for catalog retrieval.
+
+  L1: normalised query text            → query embedding (float32)
+  L2: (query key, k, filter, search type, scope, index version) → result doc ids
+
+Both levels are bounded, thread-safe and count hits/misses. A change of
+index version (index rebuilt) clears both levels.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(str(text).lower().split()).rstrip("?!. ")
+
+
+class RetrievalCache:
+    def __init__(self, embedding_size: int, result_size: int):
+        self.embeddings = LRUCache(embedding_size)
+        self.results = LRUCache(result_size)
+        self.index_version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, index_version):
+        with self._lock:
+            if index_version != self.index_version:
+                self.embeddings.clear()
+                self.results.clear()
+                self.index_version = index_version
+
+    def embed(self, query: str, embed_fn) -> np.ndarray:
+        key = normalize_query(query)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = np.asarray(embed_fn(query), dtype=np.float32)
+            self.embeddings.put(key, vector)
+        return vector
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        index_version,
+        embed_fn,
+        search_fn,
+        resolve_fn,
+        filter=None,
+        search_type: str = "similarity",
+        scope=None,
+    ):
+        """
+        embed_fn(query)         → embedding
+        search_fn(vector)       → documents carrying metadata["doc_id"]
+        resolve_fn(doc_ids)     → documents for cached ids
+        scope                   → extra key part, e.g. the index shards searched
+        """
+        self._check_version(index_version)
+
+        key = (
+            normalize_query(query),
+            k,
+            json.dumps(filter, sort_keys=True, default=str),
+            search_type,
+            json.dumps(scope, sort_keys=True, default=str),
+            index_version,
+        )
+
+        doc_ids = self.results.get(key)
+        if doc_ids is not None:
+            return resolve_fn(doc_ids)
+
+        docs = search_fn(self.embed(query, embed_fn))
+        self.results.put(key, tuple(d.metadata["doc_id"] for d in docs))
+        return docs
+
+    def stats(self) -> dict:
+        return {
+            "index_version": self.index_version,
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+        }
@@ -0,0 +1,252 @@
+# retrieval_service.py
+"""
+Local retrieval service.
+
+Owns ONE embedding model + FAISS index per host and serves top-k /
+metadata-filtered searches over localhost HTTP to any number of
+Streamlit or batch workers. Concurrent query embeddings are
+micro-batched within a short time window.
+
+With ENABLE_INDEX_SHARDS the service holds the lazily loaded shards
+(and their memory budget) instead of the monolithic index, and routes
+each request by the planner category / country the worker sends.
+
+Run:
+    python retrieval_service.py
+
+Then point workers at it with RETRIEVAL_SERVICE_URL in config.py.
+"""
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from langchain_core.documents import Document
+
+from config import (
+    ENABLE_INDEX_SHARDS,
+    RETRIEVAL_BATCH_WINDOW_MS,
+    RETRIEVAL_MAX_BATCH,
+    RETRIEVAL_SERVICE_HOST,
+    RETRIEVAL_SERVICE_PORT,
+    RETRIEVAL_SERVICE_TIMEOUT,
+    RETRIEVAL_SERVICE_URL,
+)
+
+
+# --------------------------------------------------
+# Micro-batched query embedding
+# --------------------------------------------------
+
+class QueryBatcher:
+    """
+    Collects queries arriving within `window_ms` of the first one
+    (up to `max_batch`) and embeds them in a single model call.
+    """
+
+    def __init__(self, embeddings, window_ms=RETRIEVAL_BATCH_WINDOW_MS, max_batch=RETRIEVAL_MAX_BATCH):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def embed(self, text: str):
+        future = Future()
+        self._pending.put((text, future))
+        return future.result()
+
+    def _loop(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.window
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+# --------------------------------------------------
+# Search
+# --------------------------------------------------
+
+class RetrievalService:
+    def __init__(self, sharded: bool = ENABLE_INDEX_SHARDS):
+        from rag import (
+            build_shard_manager,
+            build_vectorstore,
+            cached_search,
+            get_embeddings,
+            retrieval_cache,
+            sharded_search,
+        )
+
+        self.cached_search = cached_search
+        self.sharded_search = sharded_search
+        self.cache = retrieval_cache
+
+        embeddings = get_embeddings()
+        self.shards = build_shard_manager(embeddings) if sharded else None
+        self.vectorstore = None if sharded else build_vectorstore(embeddings)
+        self.batcher = QueryBatcher(embeddings)
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        filter=None,
+        search_type: str = "similarity",
+        category: str = "unknown",
+        country: str = "any",
+    ):
+        if self.shards is not None:
+            # Shard routing supplies the filter and RAG_SEARCH_TYPE
+            return self.sharded_search(
+                query,
+                k,
+                category,
+                country,
+                manager=self.shards,
+                embed_fn=self.batcher.embed,
+            )
+
+        return self.cached_search(
+            self.vectorstore,
+            query,
+            k,
+            embed_fn=self.batcher.embed,
+            filter=filter,
+            search_type=search_type,
+        )
+
+
+def _make_handler(service: RetrievalService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif self.path == "/stats":
+                stats = service.cache.stats()
+                if service.shards is not None:
+                    stats["shards"] = service.shards.stats()
+                self._send(200, stats)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/search":
+                self._send(404, {"error": "not found"})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                req = json.loads(self.rfile.read(length) or b"{}")
+                docs = service.search(
+                    req["query"],
+                    k=int(req.get("k", 6)),
+                    filter=req.get("filter"),
+                    search_type=req.get("search_type", "similarity"),
+                    category=req.get("category") or "unknown",
+                    country=req.get("country") or "any",
+                )
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+
+            self._send(
+                200,
+                {
+                    "documents": [
+                        {"page_content": d.page_content, "metadata": d.metadata}
+                        for d in docs
+                    ]
+                },
+            )
+
+        def log_message(self, format, *args):
+            # Keep the service quiet; workers log on their side
+            pass
+
+    return Handler
+
+
+def serve(host: str = RETRIEVAL_SERVICE_HOST, port: int = RETRIEVAL_SERVICE_PORT):
+    service = RetrievalService()
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    print(f"Retrieval service listening on http://{host}:{port}")
+    server.serve_forever()
+
+
+# --------------------------------------------------
+# Client
+# --------------------------------------------------
+
+_session = requests.Session()
+
+
+def remote_search(
+    query: str,
+    k: int,
+    filter=None,
+    search_type: str = "similarity",
+    url: str = RETRIEVAL_SERVICE_URL,
+    category: str = "unknown",
+    country: str = "any",
+):
+    response = _session.post(
+        f"{url.rstrip('/')}/search",
+        json={
+            "query": query,
+            "k": k,
+            "filter": filter,
+            "search_type": search_type,
+            "category": category,
+            "country": country,
+        },
+        timeout=RETRIEVAL_SERVICE_TIMEOUT,
+    )
+
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Retrieval service error {response.status_code}: {response.text}"
+        )
+
+    return [
+        Document(page_content=d["page_content"], metadata=d["metadata"])
+        for d in response.json()["documents"]
+    ]
+
+
+if __name__ == "__main__":
+    serve()
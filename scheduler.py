@@ -0,0 +1,325 @@
+# scheduler.py
+"""
+Priority-aware rate-limit scheduler for outbound provider calls.
+
+Every OpenRouter / Tavily / Hugging Face call goes through throttle():
+
+    with throttle("openrouter", tokens=estimate_tokens(prompt),
+                  completion_tokens=COMPLETION_TOKENS["blog"]) as charge:
+        response = llm.invoke(prompt)
+        charge.settle(response_tokens(response))
+
+- The tokens/min bucket is charged prompt + expected completion up front
+  (completion_tokens, default PROVIDER_LIMITS[...]["completion_tokens"])
+  and reconciled with the usage the provider reports after the call.
+- Per-provider token buckets for requests/min and tokens/min.
+- Priority classes: INTERACTIVE always goes before BULK on a provider.
+- Fair queuing across users within a class: the waiting user with the
+  fewest grants so far goes next.
+- Queue-depth and wait-time metrics per provider.
+
+dispatch() is the non-blocking core, driven purely by the injected
+clock, so tests can use a fake clock and submit()/dispatch() directly.
+"""
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import PROVIDER_LIMITS
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+_context = ContextVar("rate_limit_context", default=(PRIORITY_INTERACTIVE, "anonymous"))
+
+
+def estimate_tokens(text) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return len(str(text)) // 4 + 1
+
+
+def response_tokens(response):
+    """
+    Total tokens (prompt + completion) a LangChain response reports, or
+    None when the provider sent no usage. Accepts an AIMessage or LLMResult.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.get("total_tokens"):
+        return usage["total_tokens"]
+
+    llm_output = getattr(response, "llm_output", None) or {}
+    usage = llm_output.get("token_usage") or {}
+    return usage.get("total_tokens")
+
+
+# --------------------------------------------------
+# Token bucket
+# --------------------------------------------------
+
+class TokenBucket:
+    def __init__(self, per_minute: float, now: float, burst: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def cost(self, amount: float) -> float:
+        # A single request larger than the bucket would never fit
+        return min(amount, self.capacity)
+
+    def time_until(self, amount: float) -> float:
+        missing = self.cost(amount) - self.level
+        return max(0.0, missing / self.rate) if self.rate else float("inf")
+
+
+class _Charge:
+    """
+    Yielded by throttle(): settle() corrects the tokens/min bucket with the
+    real usage once the call has returned.
+    """
+
+    def __init__(self, scheduler, provider: str, charged: int):
+        self.scheduler = scheduler
+        self.provider = provider
+        self.charged = charged
+        self.settled = False
+
+    def settle(self, actual_tokens):
+        if actual_tokens is None or self.settled:
+            return  # no usage reported → the up-front estimate stands
+        self.settled = True
+        self.scheduler.adjust_tokens(self.provider, actual_tokens - self.charged)
+
+
+class _Ticket:
+    __slots__ = ("provider", "tokens", "priority", "user", "seq", "enqueued_at", "granted")
+
+    def __init__(self, provider, tokens, priority, user, seq, enqueued_at):
+        self.provider = provider
+        self.tokens = tokens
+        self.priority = priority
+        self.user = user
+        self.seq = seq
+        self.enqueued_at = enqueued_at
+        self.granted = False
+
+
+# --------------------------------------------------
+# Scheduler
+# --------------------------------------------------
+
+class RateLimitScheduler:
+    def __init__(self, limits: dict = PROVIDER_LIMITS, clock=time.monotonic):
+        self.clock = clock
+        now = clock()
+
+        self._completion = {
+            provider: limit.get("completion_tokens", 0) for provider, limit in limits.items()
+        }
+        self._buckets = {
+            provider: {
+                "requests": TokenBucket(limit["rpm"], now, limit.get("burst")),
+                "tokens": TokenBucket(limit["tpm"], now) if limit.get("tpm") else None,
+            }
+            for provider, limit in limits.items()
+        }
+
+        # provider → priority → user → deque[_Ticket]
+        self._queues = defaultdict(lambda: defaultdict(lambda: defaultdict(deque)))
+        # provider → user → grants so far (fair-share virtual time)
+        self._served = defaultdict(lambda: defaultdict(int))
+        self._waits = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    # ---------- core (non-blocking) ----------
+
+    def submit(self, provider: str, tokens: int = 0, priority: int = PRIORITY_INTERACTIVE, user: str = "anonymous") -> _Ticket:
+        with self._cond:
+            users = self._queues[provider][priority]
+            served = self._served[provider]
+
+            if not users[user]:
+                # A newly active user starts level with the others instead of
+                # replaying every grant it "missed" while idle.
+                active = [served[u] for u, q in users.items() if q and u != user]
+                if active:
+                    served[user] = max(served[user], min(active))
+
+            ticket = _Ticket(provider, tokens, priority, user, next(self._seq), self.clock())
+            users[user].append(ticket)
+            return ticket
+
+    def _next_ticket(self, provider: str):
+        for priority in sorted(self._queues[provider]):
+            users = self._queues[provider][priority]
+            waiting = [(self._served[provider][u], q[0].seq, u) for u, q in users.items() if q]
+            if waiting:
+                return users[min(waiting)[2]][0]
+        return None
+
+    def dispatch(self) -> float:
+        """
+        Grants every ticket the buckets allow right now.
+        Returns seconds until the next grant could happen (inf if idle).
+        """
+        with self._cond:
+            now = self.clock()
+            wake = float("inf")
+
+            for provider in list(self._queues):
+                if provider not in self._buckets:
+                    # Unlimited provider: grant everything
+                    for users in self._queues[provider].values():
+                        for queue in users.values():
+                            while queue:
+                                self._grant(queue.popleft(), now)
+                    del self._queues[provider]
+                    self._served.pop(provider, None)
+                    continue
+
+                requests = self._buckets[provider]["requests"]
+                tokens = self._buckets[provider]["tokens"]
+                requests.refill(now)
+                if tokens:
+                    tokens.refill(now)
+
+                while True:
+                    ticket = self._next_ticket(provider)
+                    if ticket is None:
+                        break
+
+                    delay = requests.time_until(1)
+                    if tokens:
+                        delay = max(delay, tokens.time_until(ticket.tokens))
+
+                    if delay > 0:
+                        wake = min(wake, delay)
+                        break
+
+                    requests.level -= requests.cost(1)
+                    if tokens:
+                        tokens.level -= tokens.cost(ticket.tokens)
+
+                    self._queues[provider][ticket.priority][ticket.user].popleft()
+                    self._served[provider][ticket.user] += 1
+                    self._grant(ticket, now)
+                    self._prune(provider, ticket.priority, ticket.user)
+
+            self._cond.notify_all()
+            return wake
+
+    def _prune(self, provider: str, priority: int, user: str):
+        """
+        Users are session ids, so idle ones must not accumulate: drop an
+        emptied queue, and the fair-share counter once the user has nothing
+        queued on this provider (submit() re-levels returning users).
+        """
+        priorities = self._queues[provider]
+        if not priorities[priority][user]:
+            del priorities[priority][user]
+            if not priorities[priority]:
+                del priorities[priority]
+
+        if not any(user in users for users in priorities.values()):
+            self._served[provider].pop(user, None)
+
+    def _grant(self, ticket: _Ticket, now: float):
+        ticket.granted = True
+        waited = now - ticket.enqueued_at
+        stats = self._waits[ticket.provider]
+        stats["count"] += 1
+        stats["total"] += waited
+        stats["max"] = max(stats["max"], waited)
+
+    # ---------- blocking API ----------
+
+    def acquire(self, provider: str, tokens: int = 0, priority: int = None, user: str = None):
+        ctx_priority, ctx_user = _context.get()
+        ticket = self.submit(
+            provider,
+            tokens,
+            ctx_priority if priority is None else priority,
+            ctx_user if user is None else user,
+        )
+
+        while True:
+            wake = self.dispatch()
+            with self._cond:
+                if ticket.granted:
+                    return
+                # Woken early by another dispatch, or when the bucket refills
+                self._cond.wait(timeout=min(wake, 1.0))
+
+    @contextmanager
+    def throttle(self, provider: str, tokens: int = 0, completion_tokens: int = None):
+        if completion_tokens is None:
+            completion_tokens = self._completion.get(provider, 0)
+
+        charged = tokens + completion_tokens
+        self.acquire(provider, charged)
+
+        bucket = self._buckets.get(provider, {}).get("tokens")
+        yield _Charge(self, provider, bucket.cost(charged) if bucket else charged)
+
+    def adjust_tokens(self, provider: str, delta: int):
+        """
+        Charges (delta > 0) or refunds (delta < 0) the tokens/min bucket
+        after a call. Overdraft is capped at one bucket so a single huge
+        reply cannot stall a provider for more than a minute.
+        """
+        with self._cond:
+            bucket = self._buckets.get(provider, {}).get("tokens")
+            if bucket is None or not delta:
+                return
+            bucket.refill(self.clock())
+            bucket.level = max(-bucket.capacity, min(bucket.capacity, bucket.level - delta))
+            self._cond.notify_all()
+
+    # ---------- metrics ----------
+
+    def metrics(self) -> dict:
+        with self._cond:
+            result = {}
+            for provider in set(self._queues) | set(self._waits):
+                depth = {
+                    priority: sum(len(q) for q in users.values())
+                    for priority, users in self._queues.get(provider, {}).items()
+                }
+                waits = self._waits[provider]
+                result[provider] = {
+                    "queued": sum(depth.values()),
+                    "queued_by_priority": depth,
+                    "granted": waits["count"],
+                    "avg_wait_s": round(waits["total"] / waits["count"], 3) if waits["count"] else 0.0,
+                    "max_wait_s": round(waits["max"], 3),
+                }
+            return result
+
+
+@contextmanager
+def request_context(priority: int = PRIORITY_INTERACTIVE, user: str = "anonymous"):
+    """
+    Tags every throttled call made in this thread/context with a priority
+    class and user for fair queuing.
+    """
+    token = _context.set((priority, user))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+scheduler = RateLimitScheduler()
+
+
+def throttle(provider: str, tokens: int = 0, completion_tokens: int = None):
+    return scheduler.throttle(provider, tokens, completion_tokens)
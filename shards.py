@@ -0,0 +1,202 @@
+# shards.py
+"""
+Per-category / per-country FAISS index shards.
+
+The catalog index is split into one shard per (category, country), e.g.
+"body__India". Shards are loaded on first use and evicted LRU-first when
+the resident estimate exceeds the memory budget. The planner's category
+(and country, when it names one) decides which shards a query touches;
+"mixed" / "unknown" fan out to every shard and merge by distance.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from config import MMR_FETCH_K, MMR_LAMBDA
+
+MANIFEST_FILE = "manifest.json"
+DOC_OVERHEAD_BYTES = 512  # docstore + mapping overhead per document (estimate)
+
+# Planner category → (catalog categories, extra metadata filter)
+PLANNER_SHARDS = {
+    "perfume": (["body"], {"subcategory": "perfume"}),
+    # "body" is mostly perfume; body care is everything else in it
+    "bodycare": (["body"], {"subcategory": {"$nin": ["perfume"]}}),
+    "cosmetic": (["lips", "eyes", "face"], None),
+    "skincare": (["skincare"], None),
+    "haircare": (["hair"], None),
+}
+
+
+def shard_key(category: str, country: str) -> str:
+    return f"{category}__{country}"
+
+
+class ShardManager:
+    def __init__(self, shard_dir: str, embeddings, prepare_documents, budget_mb: float):
+        """
+        prepare_documents(embeddings) → (docs, vectors) is only called when
+        the shards have not been built yet.
+        """
+        self.shard_dir = shard_dir
+        self.embeddings = embeddings
+        self.budget = budget_mb * 1024 * 1024
+
+        self._loaded = OrderedDict()  # key → (store, {doc_id: position})
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+        manifest_path = os.path.join(shard_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            self._build(*prepare_documents(embeddings))
+
+        with open(manifest_path, "r") as f:
+            self.manifest = json.load(f)
+
+    # ---------- build ----------
+
+    def _build(self, docs, vectors):
+        groups = {}
+        for i, doc in enumerate(docs):
+            key = shard_key(doc.metadata["category"], doc.metadata["country"])
+            groups.setdefault(key, []).append(i)
+
+        manifest = {"built_at": time.time(), "shards": {}, "doc_shard": {}}
+
+        for key, members in groups.items():
+            store = FAISS.from_embeddings(
+                [(docs[i].page_content, vectors[i].tolist()) for i in members],
+                self.embeddings,
+                metadatas=[docs[i].metadata for i in members],
+                ids=[docs[i].metadata["doc_id"] for i in members],
+            )
+            store.save_local(os.path.join(self.shard_dir, key))
+
+            first = docs[members[0]].metadata
+            manifest["shards"][key] = {
+                "category": first["category"],
+                "country": first["country"],
+                "count": len(members),
+                "bytes": int(
+                    len(members) * vectors.shape[1] * 4
+                    + sum(len(docs[i].page_content) for i in members)
+                    + len(members) * DOC_OVERHEAD_BYTES
+                ),
+            }
+            for i in members:
+                manifest["doc_shard"][docs[i].metadata["doc_id"]] = key
+
+        with open(os.path.join(self.shard_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+
+    # ---------- routing ----------
+
+    @property
+    def version(self):
+        return self.manifest["built_at"]
+
+    def route(self, category: str, country: str = "any"):
+        """
+        Returns (shard keys, metadata filter) for a planner category/country.
+        """
+        categories, filter = PLANNER_SHARDS.get(category, (None, None))
+
+        keys = [
+            key for key, info in self.manifest["shards"].items()
+            if (categories is None or info["category"] in categories)
+            and (country in (None, "", "any") or info["country"].lower() == country.lower())
+        ]
+
+        if not keys:
+            # Unknown country / empty route → fan out over the whole catalog
+            keys = list(self.manifest["shards"])
+            filter = None
+
+        return sorted(keys), filter
+
+    # ---------- lazy load + eviction ----------
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+
+            store = FAISS.load_local(
+                os.path.join(self.shard_dir, key),
+                self.embeddings,
+                allow_dangerous_deserialization=True,
+            )
+            entry = (
+                store,
+                {doc_id: pos for pos, doc_id in store.index_to_docstore_id.items()},
+            )
+            self._loaded[key] = entry
+            self.loads += 1
+
+            # Evict least-recently used shards, never the one just loaded
+            while len(self._loaded) > 1 and self.resident_bytes() > self.budget:
+                self._loaded.popitem(last=False)
+                self.evictions += 1
+
+            return entry
+
+    def resident_bytes(self) -> int:
+        return sum(self.manifest["shards"][key]["bytes"] for key in self._loaded)
+
+    # ---------- search ----------
+
+    def search(self, vector, keys, k: int, filter=None, search_type: str = "similarity"):
+        """
+        Fans out over `keys` and merges by distance. For MMR, candidates
+        from every shard are re-ranked together using their stored vectors.
+        """
+        n = max(MMR_FETCH_K, k) if search_type == "mmr" else k
+        candidates = []
+
+        for key in keys:
+            store, positions = self.get(key)
+            for doc, score in store.similarity_search_with_score_by_vector(
+                vector, k=n, filter=filter, fetch_k=n * 4
+            ):
+                candidates.append(
+                    (score, doc, store.index.reconstruct(positions[doc.metadata["doc_id"]]))
+                )
+
+        # FAISS returns L2 distances: lower is closer
+        candidates.sort(key=lambda c: c[0])
+        candidates = candidates[:n]
+
+        if search_type != "mmr" or not candidates:
+            return [doc for _, doc, _ in candidates[:k]]
+
+        picked = maximal_marginal_relevance(
+            np.asarray(vector, dtype=np.float32),
+            [vec for _, _, vec in candidates],
+            lambda_mult=MMR_LAMBDA,
+            k=k,
+        )
+        return [candidates[i][1] for i in picked]
+
+    def resolve(self, doc_ids):
+        docs = []
+        for doc_id in doc_ids:
+            store, _ = self.get(self.manifest["doc_shard"][doc_id])
+            docs.append(store.docstore.search(doc_id))
+        return docs
+
+    def stats(self) -> dict:
+        return {
+            "loaded": list(self._loaded),
+            "resident_mb": round(self.resident_bytes() / 1024 / 1024, 2),
+            "budget_mb": round(self.budget / 1024 / 1024, 2),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -1,24 +1,268 @@
 # storage.py
+"""
+History persistence (SQLite + FTS5).
+
+Runs are stored in `runs`; topic, research, blog and LinkedIn copy are
+full-text indexed in `runs_fts`. Listing and search return only light
+columns (id, topic, created_at) one page at a time — heavy fields are
+loaded per record with load_record() when the user opens it.
+
+`prewarm` holds research precomputed by prewarm.py, keyed by normalised
+topic, with a freshness timestamp.
+"""
 import json
 import os
-from config import MAX_HISTORY
+import sqlite3
+import time
+
+from config import HISTORY_PAGE_SIZE, MAX_HISTORY, PREWARM_TTL_HOURS
+
+HISTORY_DB = "history.db"
+HISTORY_FILE = "history.json"  # legacy store, migrated on first run
+
+# Columns with their own storage; everything else goes to `extra` (JSON)
+RECORD_FIELDS = ["topic", "research", "blog", "linkedin"]
+JSON_FIELDS = ["images"]
+
+_fts_enabled = None
+
+
+def _connect():
+    conn = sqlite3.connect(HISTORY_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # Same normalisation in SQL as in Python (popular_topics ↔ prewarm rows)
+    conn.create_function("topic_key", 1, topic_key, deterministic=True)
+    return conn
+
+
+def init_db():
+    global _fts_enabled
+
+    with _connect() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                research TEXT,
+                blog TEXT,
+                linkedin TEXT,
+                images TEXT,
+                extra TEXT
+            )
+            """
+        )
+
+        try:
+            conn.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS runs_fts USING fts5(
+                    topic, research, blog, linkedin,
+                    content='runs', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS runs_ai AFTER INSERT ON runs BEGIN
+                    INSERT INTO runs_fts(rowid, topic, research, blog, linkedin)
+                    VALUES (new.id, new.topic, new.research, new.blog, new.linkedin);
+                END;
+                CREATE TRIGGER IF NOT EXISTS runs_ad AFTER DELETE ON runs BEGIN
+                    INSERT INTO runs_fts(runs_fts, rowid, topic, research, blog, linkedin)
+                    VALUES ('delete', old.id, old.topic, old.research, old.blog, old.linkedin);
+                END;
+                """
+            )
+            _fts_enabled = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 → LIKE search on topic only
+            _fts_enabled = False
+
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prewarm (
+                topic_key TEXT PRIMARY KEY,
+                topic TEXT NOT NULL,
+                plan TEXT,
+                catalog TEXT,
+                web TEXT,
+                research TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+        empty = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0
+
+    if empty and os.path.exists(HISTORY_FILE):
+        with open(HISTORY_FILE, "r") as f:
+            for record in json.load(f):
+                add_to_history(record)
+
+
+def _fts_query(text: str) -> str:
+    # Each word becomes a quoted prefix term: `best perf` → "best"* "perf"*
+    terms = [t.replace('"', '""') for t in text.split()]
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+# --------------------------------------------------
+# Public API
+# --------------------------------------------------
+
+def add_to_history(record: dict) -> int:
+    """
+    Stores a run and returns its id. Keeps the newest MAX_HISTORY runs.
+    """
+    extra = {
+        k: v for k, v in record.items()
+        if k not in RECORD_FIELDS + JSON_FIELDS + ["run_id"]
+    }
+
+    with _connect() as conn:
+        cursor = conn.execute(
+            "INSERT INTO runs (topic, created_at, research, blog, linkedin, images, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.get("topic", ""),
+                time.time(),
+                record.get("research"),
+                record.get("blog"),
+                record.get("linkedin"),
+                json.dumps(record.get("images")),
+                json.dumps(extra, default=str),
+            ),
+        )
+        conn.execute(
+            "DELETE FROM runs WHERE id NOT IN "
+            "(SELECT id FROM runs ORDER BY id DESC LIMIT ?)",
+            (MAX_HISTORY,),
+        )
+        return cursor.lastrowid
+
+
+def search_history(query: str = "", page: int = 0, page_size: int = HISTORY_PAGE_SIZE):
+    """
+    Returns (rows, total) — rows hold only id, topic and created_at,
+    newest first (or best match first when searching).
+    """
+    query = query.strip()
+    offset = page * page_size
+
+    with _connect() as conn:
+        if not query:
+            total = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            rows = conn.execute(
+                "SELECT id, topic, created_at FROM runs "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                (page_size, offset),
+            ).fetchall()
+
+        elif _fts_enabled:
+            match = _fts_query(query)
+            total = conn.execute(
+                "SELECT COUNT(*) FROM runs_fts WHERE runs_fts MATCH ?", (match,)
+            ).fetchone()[0]
+            rows = conn.execute(
+                "SELECT r.id, r.topic, r.created_at FROM runs_fts "
+                "JOIN runs r ON r.id = runs_fts.rowid "
+                "WHERE runs_fts MATCH ? ORDER BY bm25(runs_fts), r.id DESC "
+                "LIMIT ? OFFSET ?",
+                (match, page_size, offset),
+            ).fetchall()
+
+        else:
+            like = f"%{query}%"
+            total = conn.execute(
+                "SELECT COUNT(*) FROM runs WHERE topic LIKE ?", (like,)
+            ).fetchone()[0]
+            rows = conn.execute(
+                "SELECT id, topic, created_at FROM runs WHERE topic LIKE ? "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                (like, page_size, offset),
+            ).fetchall()
+
+    return [dict(r) for r in rows], total
+
+
+def load_record(run_id: int):
+    """
+    Loads one run with all heavy fields, in the shape ContentOrchestrator returns.
+    """
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+
+    if row is None:
+        return None
+
+    record = json.loads(row["extra"] or "{}")
+    record.update(
+        {
+            "run_id": row["id"],
+            "topic": row["topic"],
+            "research": row["research"],
+            "blog": row["blog"],
+            "linkedin": row["linkedin"],
+            "images": json.loads(row["images"]) if row["images"] else None,
+        }
+    )
+    return record
+
+
+# --------------------------------------------------
+# Pre-warmed research
+# --------------------------------------------------
+
+def topic_key(topic: str) -> str:
+    return " ".join(str(topic).lower().split())
+
+
+def popular_topics(limit: int, min_count: int = 1):
+    """
+    Most frequently requested topics (normalised), most recent first on ties.
+    """
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT topic, COUNT(*) AS runs, MAX(created_at) AS last_run FROM runs "
+            "GROUP BY topic_key(topic) HAVING runs >= ? "
+            "ORDER BY runs DESC, last_run DESC LIMIT ?",
+            (min_count, limit),
+        ).fetchall()
+    return [r["topic"].strip() for r in rows]
+
 
-HISTORY_FILE = "history.json"
+def save_prewarmed(topic: str, stages: dict):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO prewarm "
+            "(topic_key, topic, plan, catalog, web, research, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                topic_key(topic),
+                topic,
+                json.dumps(stages.get("plan")),
+                stages.get("catalog"),
+                stages.get("web"),
+                stages.get("research"),
+                time.time(),
+            ),
+        )
 
 
-def load_history():
-    if not os.path.exists(HISTORY_FILE):
-        return []
-    with open(HISTORY_FILE, "r") as f:
-        return json.load(f)
+def load_prewarmed(topic: str, max_age: float = PREWARM_TTL_HOURS * 3600):
+    """
+    Fresh pre-warmed stages for `topic`, or None.
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM prewarm WHERE topic_key = ? AND created_at >= ?",
+            (topic_key(topic), time.time() - max_age),
+        ).fetchone()
 
+    if row is None:
+        return None
 
-def save_history(history):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history[-MAX_HISTORY:], f, indent=2)
+    record = dict(row)
+    record["plan"] = json.loads(record["plan"]) if record["plan"] else None
+    return record
 
 
-def add_to_history(history, record):
-    history.append(record)
-    save_history(history)
-    return history[-MAX_HISTORY:]
+init_db()
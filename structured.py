@@ -0,0 +1,323 @@
+# structured.py
+"""
+Structured (JSON) LLM outputs for the planner and image prompt agent.
+
+  1. Ask the provider for JSON (STRUCTURED_OUTPUT_MODE: "json_object",
+     "json_schema" or "off" for models that reject response_format).
+  2. Stream the reply and scan it incrementally; the stream is closed as
+     soon as the first top-level object is complete.
+  3. Repair common noise locally: code fences, text around the object,
+     trailing commas, Python literals (True / None).
+  4. Validate and coerce against a small schema (types, enums, ranges).
+     Fields with a "default" are soft: missing / invalid values take the
+     default and never count as errors.
+  5. On failure of a required field, re-ask once (STRUCTURED_MAX_REASKS)
+     with the exact errors.
+
+Raises StructuredOutputError (a ValueError) when no valid object is produced.
+"""
+import json
+import re
+
+import openai
+from langchain_core.messages import AIMessage, HumanMessage
+
+from config import COMPLETION_TOKENS, STRUCTURED_MAX_REASKS, STRUCTURED_OUTPUT_MODE
+from scheduler import estimate_tokens, throttle
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+# --------------------------------------------------
+# Schemas
+# --------------------------------------------------
+# field → {"type": bool | int | str, "enum": [...], "min": n, "max": n,
+#           "default": value}   (default → optional, never re-asked)
+
+# Only allowed / top_k gate a run; the rest only tune routing and logging,
+# so an unexpected value ("UK", "fragrance") falls back instead of failing.
+PLAN_SCHEMA = {
+    "allowed": {"type": bool},
+    "top_k": {"type": int, "min": 1, "max": 20},
+    "category": {
+        "type": str,
+        "enum": ["perfume", "cosmetic", "skincare", "haircare", "bodycare", "mixed", "unknown"],
+        "default": "unknown",  # shard routing fans out over the whole catalog
+    },
+    "country": {"type": str, "enum": ["India", "USA", "any"], "default": "any"},
+    "intent": {
+        "type": str,
+        "enum": ["list", "comparison", "recommendation", "informational", "unknown"],
+        "default": "informational",
+    },
+}
+
+IMAGE_PROMPT_SCHEMA = {
+    "caption": {"type": str},
+    "prompt": {"type": str},
+}
+
+_JSON_TYPES = {bool: "boolean", int: "integer", str: "string"}
+
+
+def json_schema(schema: dict) -> dict:
+    properties = {}
+    for field, spec in schema.items():
+        prop = {"type": _JSON_TYPES[spec["type"]]}
+        if "enum" in spec:
+            prop["enum"] = spec["enum"]
+        properties[field] = prop
+
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(schema),
+        "additionalProperties": False,
+    }
+
+
+def _coerce(value, spec):
+    kind = spec["type"]
+
+    if kind is bool:
+        if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+            return value.strip().lower() == "true"
+        if not isinstance(value, bool):
+            raise ValueError("expected true or false")
+        return value
+
+    if kind is int:
+        if isinstance(value, bool):
+            raise ValueError("expected an integer")
+        try:
+            value = int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            # OverflowError: valid JSON like 1e999 → float('inf')
+            raise ValueError("expected an integer")
+        # Out-of-range counts are clamped rather than re-asked
+        return max(spec.get("min", value), min(spec.get("max", value), value))
+
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("expected a non-empty string")
+    value = value.strip()
+
+    if "enum" in spec:
+        matches = [e for e in spec["enum"] if e.lower() == value.lower()]
+        if not matches:
+            raise ValueError(f"expected one of {spec['enum']}")
+        return matches[0]
+
+    return value
+
+
+def validate(obj, schema: dict):
+    """
+    Returns (coerced object, errors). Unknown fields are dropped; soft
+    fields (with a default) fall back silently.
+    """
+    if not isinstance(obj, dict):
+        return None, ["expected a JSON object"]
+
+    result, errors = {}, []
+    for field, spec in schema.items():
+        soft = "default" in spec
+
+        if field not in obj or (soft and obj[field] is None):
+            if soft:
+                result[field] = spec["default"]
+            else:
+                errors.append(f"missing field '{field}'")
+            continue
+
+        try:
+            result[field] = _coerce(obj[field], spec)
+        except ValueError as e:
+            if soft:
+                result[field] = spec["default"]
+            else:
+                errors.append(f"'{field}': {e} (got {obj[field]!r})")
+
+    return result, errors
+
+
+# --------------------------------------------------
+# Incremental parsing + local repair
+# --------------------------------------------------
+
+class ObjectScanner:
+    """
+    Fed streamed text; `complete` turns True once the first top-level
+    {...} closes. Tracks strings/escapes so braces inside values are ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.end = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str):
+        offset = len(self.text)
+        self.text += chunk
+
+        for i, ch in enumerate(chunk, offset):
+            if self.complete:
+                return
+            if self.start is None:
+                if ch == "{":
+                    self.start, self._depth = i, 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = i + 1
+
+    def candidate(self) -> str:
+        if self.start is None:
+            return self.text
+        return self.text[self.start:self.end]
+
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def parse_json_object(text: str):
+    """
+    Parses the first JSON object in `text`, repairing fences, surrounding
+    text, trailing commas and Python literals. Raises ValueError.
+    """
+    scanner = ObjectScanner()
+    scanner.feed(_FENCE.sub("", text))
+    candidate = scanner.candidate().strip()
+
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+
+    repaired = _TRAILING_COMMA.sub(r"\1", candidate)
+    repaired = re.sub(
+        r'(?<=[:\[,\s])(True|False|None)(?=\s*[,}\]])',
+        lambda m: _PY_LITERALS[m.group(1)],
+        repaired,
+    )
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e.msg} at position {e.pos}")
+
+
+# --------------------------------------------------
+# LLM call
+# --------------------------------------------------
+
+def _response_format(schema: dict, name: str, mode: str):
+    if mode == "json_object":
+        return {"type": "json_object"}
+    if mode == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": name, "strict": True, "schema": json_schema(schema)},
+        }
+    return None
+
+
+def _stream_object(llm, messages) -> str:
+    """
+    Streams until the first top-level object closes, then drops the
+    connection instead of waiting for trailing text.
+    """
+    scanner = ObjectScanner()
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            scanner.feed(chunk.content or "")
+            if scanner.complete:
+                break
+    finally:
+        stream.close()
+    return scanner.text
+
+
+def _throttled_stream(llm, messages) -> str:
+    prompt_tokens = estimate_tokens("".join(str(m.content) for m in messages))
+
+    with throttle(
+        "openrouter",
+        tokens=prompt_tokens,
+        completion_tokens=COMPLETION_TOKENS["structured"],
+    ) as charge:
+        text = _stream_object(llm, messages)
+        # Streamed replies carry no usage (and may be cut short): charge
+        # what was actually received
+        charge.settle(prompt_tokens + estimate_tokens(text))
+    return text
+
+
+def invoke_structured(llm, prompt_value, schema: dict, name: str, log=None, stage: str = "INFO") -> dict:
+    """
+    Returns the validated object for `prompt_value` (a formatted chat prompt).
+    """
+    messages = prompt_value.to_messages()
+    mode = STRUCTURED_OUTPUT_MODE
+    response_format = _response_format(schema, name, mode)
+    bound = llm.bind(response_format=response_format) if response_format else llm
+
+    errors = []
+    for attempt in range(STRUCTURED_MAX_REASKS + 1):
+        try:
+            text = _throttled_stream(bound, messages)
+        except openai.BadRequestError:
+            if bound is llm:
+                raise
+            # Model/provider without response_format support → prompt-only JSON
+            if log:
+                log(stage, f"{name}: response_format '{mode}' rejected, using plain JSON prompt")
+            bound = llm
+            text = _throttled_stream(bound, messages)
+
+        try:
+            obj, errors = validate(parse_json_object(text), schema)
+        except ValueError as e:
+            obj, errors = None, [str(e)]
+
+        if not errors:
+            return obj
+
+        if attempt < STRUCTURED_MAX_REASKS:
+            if log:
+                log(stage, f"{name}: invalid output ({'; '.join(errors)}), re-asking once")
+            messages = messages + [
+                AIMessage(content=text),
+                HumanMessage(
+                    content=(
+                        "Your reply could not be used: "
+                        + "; ".join(errors)
+                        + ". Reply with ONLY the corrected JSON object, no other text."
+                    )
+                ),
+            ]
+
+    raise StructuredOutputError(f"{name}: {'; '.join(errors)}")
@@ -1,6 +1,7 @@
 # tools.py
 from tavily import TavilyClient
 from config import TAVILY_API_KEY
+from scheduler import throttle
 
 tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
 
@@ -10,12 +11,13 @@ def tavily_search_with_content(query: str, max_results: int = 5):
     Uses Tavily's own crawler & cached page content.
     This avoids direct HTTP requests and bot-blocking issues.
     """
-    response = tavily_client.search(
-        query=query,
-        search_depth="advanced",
-        max_results=max_results,
-        include_raw_content=True
-    )
+    with throttle("tavily"):
+        response = tavily_client.search(
+            query=query,
+            search_depth="advanced",
+            max_results=max_results,
+            include_raw_content=True
+        )
 
     results = []
     for item in response.get("results", []):